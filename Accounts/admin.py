@@ -1,3 +1,12 @@
 from django.contrib import admin
+from .models import StudentProfile
 
 # Register your models here.
+
+@admin.register(StudentProfile)
+class StudentProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'division', 'email_digest')
+    list_filter = ('email_digest', 'division')
+    search_fields = ('user__username', 'division')
+    list_editable = ('email_digest',)
+    list_select_related = ('user',)
@@ -0,0 +1,15 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class ProfileBackend(ModelBackend):
+    """
+    ModelBackend that loads the session's user together with their
+    StudentProfile, so request.user.profile needs no second query.
+    """
+
+    def get_user(self, user_id):
+        user = UserModel._default_manager.select_related('profile').filter(pk=user_id).first()
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,48 @@
+import time
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from .models import StudentProfile
+
+DIVISION_SESSION_KEY = 'profile_division'
+
+
+def get_profile(user):
+    """The user's StudentProfile (created empty if missing), or None when anonymous"""
+    if not user.is_authenticated:
+        return None
+    try:
+        # Already joined in by ProfileBackend
+        return user.profile
+    except StudentProfile.DoesNotExist:
+        profile, _ = StudentProfile.objects.get_or_create(user=user, defaults={'division': ''})
+        user.profile = profile
+        return profile
+
+
+def get_division(request):
+    """
+    The user's division. With PROFILE_DIVISION_SESSION_SECONDS set it is kept
+    in the session for that long, so requests that only need the division
+    don't have to load the profile.
+    """
+    seconds = getattr(settings, 'PROFILE_DIVISION_SESSION_SECONDS', 0)
+    if seconds and request.user.is_authenticated:
+        cached = request.session.get(DIVISION_SESSION_KEY)
+        if cached and cached[1] > time.time():
+            return cached[0]
+    profile = request.profile
+    division = profile.division if profile else ''
+    if seconds and profile:
+        request.session[DIVISION_SESSION_KEY] = (division, time.time() + seconds)
+    return division
+
+
+class ProfileMiddleware:
+    """Adds request.profile, loaded on first use"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: get_profile(request.user))
+        return self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='email_digest',
+            field=models.BooleanField(default=False),
+        ),
+    ]
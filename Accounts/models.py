@@ -5,6 +5,8 @@ from django.contrib.auth.models import User
 class StudentProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     division = models.CharField(max_length=100)
+    # Receive one email a day with all complaint updates instead of one per change
+    email_digest = models.BooleanField(default=False)
 
     def __str__(self):
         return f"Profile for {self.user.username}"
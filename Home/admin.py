@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Complaint, ComplaintCategory, ComplaintUpdate
+from .models import Complaint, ComplaintCategory, ComplaintUpdate, Notification, OutboundEmail, ReportJob, StoredBlob
 from django.utils.html import format_html
+from .search import blind_index_q
 
 # Register your models here.
 
@@ -14,7 +15,8 @@ class ComplaintCategoryAdmin(admin.ModelAdmin):
 class ComplaintAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'user', 'division', 'status', 'priority', 'complaint_date')
     list_filter = ('status', 'priority', 'complaint_date', 'category')
-    search_fields = ('name', 'division', 'complaint', 'user__username')
+    # name and complaint are encrypted; they are searched via the blind index below
+    search_fields = ('division', 'user__username')
     readonly_fields = ('complaint_date', 'user')
     list_editable = ('status', 'priority')
     
@@ -33,8 +35,41 @@ class ComplaintAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user', 'category')
 
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(blind_index_q(search_term))
+        return results, may_have_duplicates
+
 @admin.register(ComplaintUpdate)
 class ComplaintUpdateAdmin(admin.ModelAdmin):
     list_display = ('complaint', 'old_status', 'new_status', 'updated_by', 'updated_at')
     list_filter = ('old_status', 'new_status', 'updated_at')
     readonly_fields = ('updated_at',)
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
+    readonly_fields = ('attempts', 'claimed_at', 'last_error', 'created_at', 'sent_at')
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('complaint', 'user', 'event', 'status', 'created_at', 'flushed_at')
+    list_filter = ('event', 'flushed_at')
+    search_fields = ('user__username',)
+    raw_id_fields = ('user', 'complaint', 'email')
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('key', 'status', 'rows_done', 'rows_total', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('key', 'params', 'data_version', 'rows_done', 'rows_total', 'file', 'error',
+                       'created_at', 'claimed_at', 'finished_at')
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'refcount', 'created_at', 'updated_at')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'size', 'refcount', 'created_at', 'updated_at')
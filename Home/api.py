@@ -0,0 +1,226 @@
+"""
+Read-only JSON API for internal dashboards
+
+Lists are keyset-paginated like the HTML views. ``fields=`` picks the
+attributes returned; only the columns behind them are loaded, so encrypted
+fields are neither fetched nor decrypted unless asked for. Every response
+carries a strong ETag derived from the complaint DataVersion and the
+request, so an unchanged poll is answered with a 304 after a single
+primary-key lookup.
+"""
+import hashlib
+from functools import wraps
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+from .encryption import encryption_manager
+from .exports import EXPORT_FORMATS, export_response
+from .fragments import admin_panel_cache
+from .models import Complaint, ComplaintUpdate, ReportJob
+from .pagination import ORDERING, PAGE_SIZE, paginate
+from .search import filter_complaints
+from .versioning import current_version
+
+MAX_PAGE_SIZE = 200
+
+
+def _file_url(file):
+    return file.url if file else None
+
+
+# name -> (columns to load, related table to join or None, value)
+COMPLAINT_FIELDS = {
+    'id': ((), None, lambda c: c.id),
+    'user': (('user__username',), 'user', lambda c: c.user.username),
+    'name': (('name',), None, lambda c: c.name),
+    'division': (('division',), None, lambda c: c.division),
+    'complaint': (('complaint',), None, lambda c: c.complaint),
+    'preview': (('preview',), None, lambda c: c.preview),
+    'category': (('category__name',), 'category', lambda c: c.category.name if c.category else None),
+    'status': (('status',), None, lambda c: c.status),
+    'priority': (('priority',), None, lambda c: c.priority),
+    'complaint_date': ((), None, lambda c: c.complaint_date),
+    'resolved_date': (('resolved_date',), None, lambda c: c.resolved_date),
+    'admin_response': (('admin_response',), None, lambda c: c.admin_response),
+    'action_taken': (('action_taken',), None, lambda c: c.action_taken),
+    'complaint_img': (('complaint_img',), None, lambda c: _file_url(c.complaint_img)),
+    'action_image': (('action_image',), None, lambda c: _file_url(c.action_image)),
+}
+
+# Encrypted fields are left out unless requested
+DEFAULT_FIELDS = ('id', 'user', 'division', 'category', 'status', 'priority', 'complaint_date', 'resolved_date')
+
+UPDATE_KEY = ('updated_at', 'id')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def api_view(view):
+    """Staff-only, GET/HEAD-only JSON view that turns ApiError into an error response"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not (request.user.is_staff or request.user.is_superuser):
+            return JsonResponse({'error': 'Admin privileges required.'}, status=403)
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+    return require_safe(wrapper)
+
+
+def _etag(request, *args, **kwargs):
+    # The same data version and request always produce the same body
+    query = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    digest = hashlib.sha256(f'{request.path}?{query}'.encode()).hexdigest()[:20]
+    return f'{current_version()}-{digest}'
+
+
+def _requested_fields(request):
+    fields = request.GET.get('fields')
+    if not fields:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in fields.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in COMPLAINT_FIELDS]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(COMPLAINT_FIELDS)}')
+    return fields
+
+
+def _complaints(fields):
+    """Complaint queryset that loads only what the requested fields need"""
+    columns = {'id', 'complaint_date'}
+    related = set()
+    for field in fields:
+        field_columns, join, _ = COMPLAINT_FIELDS[field]
+        columns.update(field_columns)
+        if join:
+            related.add(join)
+    queryset = Complaint.objects.only(*columns)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.batch_decrypt()
+
+
+def _serialize(complaint, fields):
+    return {field: COMPLAINT_FIELDS[field][2](complaint) for field in fields}
+
+
+def _page_size(request):
+    try:
+        return max(1, min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+
+
+def _page_link(request, **cursor):
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    query.update(cursor)
+    return f'{request.path}?{query.urlencode()}'
+
+
+def _page_response(request, page, rows):
+    return JsonResponse({
+        'results': rows,
+        'next': _page_link(request, after=page.older_cursor) if page.older_cursor else None,
+        'previous': _page_link(request, before=page.newer_cursor) if page.newer_cursor else None,
+    })
+
+
+@api_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag)
+def complaint_list(request):
+    """Complaints newest first; filters: status, division, user (username), search"""
+    fields = _requested_fields(request)
+    # status and search match the Admin_Panel and the exports
+    complaints = filter_complaints(_complaints(fields), request.GET.get('status'), request.GET.get('search'))
+    if request.GET.get('division'):
+        complaints = complaints.filter(division=request.GET['division'])
+    if request.GET.get('user'):
+        complaints = complaints.filter(user__username=request.GET['user'])
+
+    page = paginate(complaints, request.GET.get('after'), request.GET.get('before'), _page_size(request))
+    return _page_response(request, page, [_serialize(c, fields) for c in page])
+
+
+@api_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag)
+def complaint_detail(request, complaint_id):
+    fields = _requested_fields(request)
+    complaint = _complaints(fields).filter(pk=complaint_id).first()
+    if complaint is None:
+        raise ApiError('Complaint not found.', status=404)
+    return JsonResponse(_serialize(complaint, fields))
+
+
+@api_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag)
+def complaint_updates(request, complaint_id):
+    """Status history of a complaint, newest first"""
+    if not Complaint.objects.filter(pk=complaint_id).exists():
+        raise ApiError('Complaint not found.', status=404)
+    updates = ComplaintUpdate.objects.filter(complaint_id=complaint_id).select_related('updated_by')
+    page = paginate(updates, request.GET.get('after'), request.GET.get('before'), _page_size(request), key=UPDATE_KEY)
+    return _page_response(request, page, [
+        {
+            'id': update.id,
+            'updated_by': update.updated_by.username,
+            'old_status': update.old_status,
+            'new_status': update.new_status,
+            'update_message': update.update_message,
+            'updated_at': update.updated_at,
+        }
+        for update in page
+    ])
+
+
+@api_view
+@cache_control(private=True, no_store=True)
+def complaint_export(request, fmt):
+    """
+    Every complaint matching the Admin_Panel filters (status, search) as CSV
+    or NDJSON, streamed while it is read. fields= selects the columns as for
+    the list, so encrypted fields are only decrypted when asked for.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ApiError(f'Unknown export format. Available: {", ".join(EXPORT_FORMATS)}', status=404)
+    fields = _requested_fields(request)
+    complaints = filter_complaints(_complaints(fields), request.GET.get('status'), request.GET.get('search'))
+    columns = [(field, COMPLAINT_FIELDS[field][2]) for field in fields]
+    return export_response(complaints.order_by(*ORDERING), columns, fmt, 'complaints')
+
+
+@api_view
+@cache_control(private=True, no_store=True)
+def report_status(request, job_id):
+    """Progress of a PDF report job, polled by the Admin_Panel Reports list"""
+    job = ReportJob.objects.filter(pk=job_id).first()
+    if job is None:
+        raise ApiError('Report not found.', status=404)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'rows_done': job.rows_done,
+        'rows_total': job.rows_total,
+        'download': reverse('download_report', args=[job.id]) if job.status == 'done' else None,
+    })
+
+
+@api_view
+@cache_control(private=True, no_store=True)
+def cache_stats(request):
+    """Hit rates of the shared fragment cache and of this process' decryption cache"""
+    return JsonResponse({
+        'admin_panel_fragments': admin_panel_cache.stats(),
+        'decryption': encryption_manager.stats(),
+    })
@@ -0,0 +1,95 @@
+"""
+Resumable, chunked rewrites of encrypted columns
+
+Rows are walked in primary-key order a chunk at a time and progress is stored
+in a BackfillCheckpoint after every chunk, so a job can be stopped and
+resumed. Each chunk is written in its own short transaction and a row is
+only rewritten if it hasn't changed since it was read, so jobs can run next
+to production traffic.
+
+Rewritten values always go to the encrypted field's own column. Where that
+column replaces a legacy one (legacy_column), the legacy value is cleared in
+the same write, so once a job has completed the legacy columns are empty and
+can be dropped.
+"""
+import time
+from django.db import transaction
+from .encryption import Ciphertext, encrypted_fields, legacy_fields, stored_values
+from .models import BackfillCheckpoint
+
+
+def _load_stored(queryset, fields):
+    with stored_values():
+        rows = list(queryset.values_list('pk', *fields))
+    return [
+        (row[0], tuple(value.value if isinstance(value, Ciphertext) else value for value in row[1:]))
+        for row in rows
+    ]
+
+
+def rewrite_encrypted_fields(model, checkpoint_name, transform, chunk_size=500, restart=False,
+                             pause=0, progress=None):
+    """
+    Rewrite the stored values of every encrypted field of model.
+
+    transform receives a list of stored values for a chunk (None for NULL)
+    and returns a list of the same length with their replacements.
+    progress, if given, is called with the checkpoint and the number of rows
+    in the chunk after every chunk.
+    Returns the checkpoint.
+    """
+    fields = [f.name for f in encrypted_fields(model)]
+    legacy = [f.name for f in legacy_fields(model)]
+    checkpoint, _ = BackfillCheckpoint.objects.get_or_create(name=checkpoint_name)
+    if restart:
+        checkpoint.last_pk = 0
+        checkpoint.rows_done = 0
+        checkpoint.completed = False
+        checkpoint.save()
+
+    while True:
+        rows = _load_stored(
+            model._default_manager.filter(pk__gt=checkpoint.last_pk).order_by('pk')[:chunk_size], fields
+        )
+        if not rows:
+            break
+
+        flat = [value for _, values in rows for value in values]
+        rewritten = iter(transform(flat))
+        changed = {}
+        for pk, values in rows:
+            new_values = tuple(next(rewritten) for _ in values)
+            if new_values != values:
+                changed[pk] = (values, new_values)
+
+        with transaction.atomic():
+            if changed:
+                # Skip rows that were edited after we read them; those edits
+                # were already written with the current key and format
+                current = dict(_load_stored(
+                    model._default_manager.select_for_update().filter(pk__in=changed), fields
+                ))
+                objs = []
+                for pk, (values, new_values) in changed.items():
+                    if current.get(pk) != values:
+                        continue
+                    obj = model(pk=pk)
+                    for field, value in zip(fields, new_values):
+                        setattr(obj, field, None if value is None else Ciphertext(value))
+                    for field in legacy:
+                        setattr(obj, field, '')
+                    objs.append(obj)
+                model._default_manager.bulk_update(objs, fields + legacy)
+
+            checkpoint.last_pk = rows[-1][0]
+            checkpoint.rows_done += len(rows)
+            checkpoint.save(update_fields=['last_pk', 'rows_done', 'updated_at'])
+
+        if progress:
+            progress(checkpoint, len(rows))
+        if pause:
+            time.sleep(pause)
+
+    checkpoint.completed = True
+    checkpoint.save(update_fields=['completed', 'updated_at'])
+    return checkpoint
@@ -0,0 +1,86 @@
+"""
+Process-wide cache of ComplaintCategory reference data
+
+Categories are read on nearly every student request but change only through
+the admin. Each process keeps them in memory and reloads them when the
+'categories' DataVersion changes, which is bumped after every committed
+category save or delete. The version lives in the database, so every
+process sees the change whatever cache backend is configured; it is checked
+at most every CATEGORY_CACHE_CHECK_SECONDS, and entries are reloaded after
+CATEGORY_CACHE_TTL in any case.
+"""
+import threading
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.db import transaction
+from .versioning import bump_version, current_version
+
+CATEGORIES = 'categories'
+
+CategoryInfo = namedtuple('CategoryInfo', ['id', 'name', 'description'])
+
+
+class CategoryCache:
+    """In-memory id -> CategoryInfo map, reloaded when the shared version changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._categories = None
+        self._version = None
+        self._loaded_at = self._checked_at = 0.0
+
+    @property
+    def version(self):
+        """Version of the loaded category data, part of keys of anything cached from it"""
+        self._current()
+        return self._version
+
+    def _current(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._categories is not None:
+                ttl = getattr(settings, 'CATEGORY_CACHE_TTL', 300)
+                interval = getattr(settings, 'CATEGORY_CACHE_CHECK_SECONDS', 5)
+                if now - self._loaded_at >= ttl:
+                    self._categories = None
+                elif now - self._checked_at >= interval:
+                    self._checked_at = now
+                    if current_version(CATEGORIES) != self._version:
+                        self._categories = None
+
+            if self._categories is None:
+                from .models import ComplaintCategory
+
+                # Take the version first: a change racing with the load is picked up next check
+                self._version = current_version(CATEGORIES)
+                self._categories = {
+                    category.id: CategoryInfo(category.id, category.name, category.description)
+                    for category in ComplaintCategory.objects.order_by('id')
+                }
+                self._loaded_at = self._checked_at = now
+            return self._categories
+
+    def all(self):
+        """All categories in id order"""
+        return list(self._current().values())
+
+    def get(self, category_id):
+        """CategoryInfo for an id (as submitted in a form), or None if there is no such category"""
+        try:
+            return self._current().get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+
+    def invalidate(self):
+        """Make every process reload once the current transaction commits"""
+        bump_version(CATEGORIES)
+
+        def reload():
+            # This process reloads on its next read instead of at the next check
+            with self._lock:
+                self._categories = None
+        transaction.on_commit(reload)
+
+
+category_cache = CategoryCache()
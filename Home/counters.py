@@ -0,0 +1,95 @@
+"""
+Materialised complaint counts per (status, division, category)
+
+The counters are adjusted in the same transaction as every write that
+creates, deletes or moves a complaint between buckets, so the dashboard can
+read its totals without counting complaints. The reconcile_complaint_counters
+command rebuilds them from the complaint table.
+"""
+from collections import Counter
+from django.db import IntegrityError, models, transaction
+
+# Complaint fields (attnames) that decide which counter a complaint is in
+COUNTER_FIELDS = ('status', 'division', 'category_id')
+
+# category_key of complaints without a category (NULLs can't be part of a unique key)
+UNCATEGORISED = 0
+
+
+def bucket(status, division, category_id):
+    return (status, division or '', category_id or UNCATEGORISED)
+
+
+def complaint_bucket(complaint):
+    return bucket(*(getattr(complaint, field) for field in COUNTER_FIELDS))
+
+
+def adjust_counters(deltas):
+    """Add {bucket: delta} to the counter table"""
+    from .models import ComplaintStatusCounter
+
+    with transaction.atomic():
+        # A fixed order keeps concurrent writers from deadlocking on the rows
+        for (status, division, category_key), delta in sorted(deltas.items()):
+            if not delta:
+                continue
+            counter = ComplaintStatusCounter.objects.filter(status=status, division=division, category_key=category_key)
+            if counter.update(count=models.F('count') + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    ComplaintStatusCounter.objects.create(
+                        status=status, division=division, category_key=category_key, count=delta,
+                    )
+            except IntegrityError:
+                # Another transaction created the row first
+                counter.update(count=models.F('count') + delta)
+
+
+def uncategorise(category_id):
+    """Move the counts of a category that is being deleted to UNCATEGORISED"""
+    from .models import ComplaintStatusCounter
+
+    with transaction.atomic():
+        counters = ComplaintStatusCounter.objects.select_for_update().filter(category_key=category_id)
+        deltas = Counter()
+        for counter in counters:
+            deltas[(counter.status, counter.division, UNCATEGORISED)] += counter.count
+        counters.delete()
+        adjust_counters(deltas)
+
+
+def status_totals(status=None):
+    """Return {status: number of complaints}, optionally for a single status"""
+    from .models import ComplaintStatusCounter
+
+    rows = ComplaintStatusCounter.objects.order_by()
+    if status:
+        rows = rows.filter(status=status)
+    rows = rows.values('status').annotate(total=models.Sum('count'))
+    return {row['status']: row['total'] for row in rows}
+
+
+def rebuild_counters():
+    """
+    Recount every bucket from the complaint table and replace the counters.
+    Returns {bucket: actual - stored} for the buckets that were off.
+    """
+    from .models import Complaint, ComplaintStatusCounter
+
+    with transaction.atomic():
+        stored = Counter()
+        for counter in ComplaintStatusCounter.objects.select_for_update():
+            stored[(counter.status, counter.division, counter.category_key)] += counter.count
+
+        actual = Counter()
+        rows = Complaint.objects.order_by().values(*COUNTER_FIELDS).annotate(total=models.Count('pk'))
+        for row in rows:
+            actual[bucket(*(row[field] for field in COUNTER_FIELDS))] += row['total']
+
+        ComplaintStatusCounter.objects.all().delete()
+        ComplaintStatusCounter.objects.bulk_create([
+            ComplaintStatusCounter(status=status, division=division, category_key=category_key, count=total)
+            for (status, division, category_key), total in actual.items()
+        ])
+    return {key: actual[key] - stored[key] for key in set(actual) | set(stored) if actual[key] != stored[key]}
@@ -2,30 +2,242 @@
 Encryption utilities for sensitive complaint data
 """
 import base64
-from cryptography.fernet import Fernet
+import contextvars
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from django.conf import settings
 from django.db import models
+from django.db.models.expressions import Col
+from django.db.models.query import ModelIterable
 import os
 
+
+class DecryptionCache:
+    """Bounded LRU cache of plaintexts keyed by the digest of their ciphertext"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.decrypt_seconds = 0.0
+
+    @staticmethod
+    def key(encrypted_text):
+        if isinstance(encrypted_text, str):
+            encrypted_text = encrypted_text.encode()
+        return hashlib.sha256(encrypted_text).digest()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def record_time(self, seconds):
+        with self._lock:
+            self.decrypt_seconds += seconds
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            self.decrypt_seconds = 0.0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'decrypt_seconds': self.decrypt_seconds,
+            }
+
+
+# Stored value formats. Legacy values are a base64 encoded Fernet token held
+# in a text column; compact values are a version byte followed by the raw
+# Fernet token bytes, held in a binary column.
+COMPACT_FORMAT_V1 = b'\x01'
+FERNET_VERSION = 0x80
+
+# Key derivation parameters for ENCRYPTION_KEY. The salt can be changed per
+# installation through ENCRYPTION_SALT as part of a key rotation.
+KDF_SALT = b'salt_1234567890'
+KDF_ITERATIONS = 100000
+
+
+def _token_from_stored(stored):
+    """Fernet token (base64 bytes) inside a stored value of either format"""
+    if is_compact(stored):
+        return base64.urlsafe_b64encode(stored[1:])
+    return base64.urlsafe_b64decode(stored.encode())
+
+
+def _compact_from_token(token):
+    return COMPACT_FORMAT_V1 + base64.urlsafe_b64decode(token)
+
+
+def _legacy_token_bytes(stored):
+    """Raw Fernet token of a legacy value, or b'' if it is unencrypted text"""
+    try:
+        token = base64.urlsafe_b64decode(stored.encode())
+        raw = base64.urlsafe_b64decode(token)
+    except (ValueError, TypeError):
+        return b''
+    return raw if raw[:1] == bytes([FERNET_VERSION]) else b''
+
+
+def compact_encrypt_with(cipher, text):
+    """Encrypt text with the given (Multi)Fernet into the compact format"""
+    if not text:
+        return text
+    return _compact_from_token(cipher.encrypt(text.encode()))
+
+
+def rotate_with(cipher, stored):
+    """
+    Re-encrypt a stored value under the primary key of a MultiFernet and return
+    it in the compact format. Unencrypted legacy text is encrypted. A token
+    that none of the active keys can read is returned unchanged.
+    """
+    if not stored:
+        return stored
+    try:
+        return _compact_from_token(cipher.rotate(_token_from_stored(stored)))
+    except (InvalidToken, ValueError, TypeError):
+        if isinstance(stored, bytes) or _legacy_token_bytes(stored):
+            # Encrypted with a key that isn't configured; encrypting it again
+            # would lose the text, so leave it for a run with that key added
+            return stored
+        return compact_encrypt_with(cipher, stored)
+
+
+def derive_fernet_key(secret_key, salt=KDF_SALT, iterations=KDF_ITERATIONS):
+    """Run PBKDF2 over the secret and return a urlsafe base64 Fernet key"""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=iterations,
+    )
+    return base64.urlsafe_b64encode(kdf.derive(secret_key.encode()))
+
+
 class EncryptionManager:
     """Manages encryption and decryption of sensitive data"""
     
     def __init__(self):
-        # Use a secret key from settings or environment
+        # The key is derived on first use rather than at import time, so
+        # worker boots and serverless cold starts don't pay for PBKDF2
+        self._cipher_suite = None
+        self._lock = threading.Lock()
+        self.cache = DecryptionCache(getattr(settings, 'ENCRYPTION_CACHE_SIZE', 4096))
+
+    @property
+    def cipher_suite(self):
+        if self._cipher_suite is None:
+            with self._lock:
+                if self._cipher_suite is None:
+                    self._cipher_suite = MultiFernet([Fernet(key) for key in self.keys()])
+        return self._cipher_suite
+
+    def warm(self):
+        """Derive the key now, e.g. in a server process before it forks workers"""
+        return self.cipher_suite
+
+    def reset(self):
+        """Forget the keys and cached plaintexts, e.g. after the key settings changed"""
+        with self._lock:
+            self._cipher_suite = None
+        self.cache.clear()
+
+    def keys(self):
+        """
+        Active Fernet keys, newest first. New data is encrypted with the first
+        one; stored data is decrypted with whichever key matches.
+        """
+        return [self.load_key()] + self.retired_keys()
+
+    def retired_keys(self):
+        """Pre-derived keys from ENCRYPTION_RETIRED_KEYS, kept only for decryption"""
+        keys = getattr(settings, 'ENCRYPTION_RETIRED_KEYS', None) or []
+        if isinstance(keys, str):
+            keys = keys.split(',')
+        return [key.strip().encode() if isinstance(key, str) else key for key in keys if key.strip()]
+
+    def load_key(self):
+        """
+        Return the primary Fernet key. A pre-derived key in
+        ENCRYPTION_DERIVED_KEY is used as-is; otherwise the key is derived from
+        ENCRYPTION_KEY and ENCRYPTION_SALT once and, if ENCRYPTION_KEY_CACHE
+        names a file, reused from there.
+        """
+        derived_key = getattr(settings, 'ENCRYPTION_DERIVED_KEY', None)
+        if derived_key:
+            return derived_key.encode() if isinstance(derived_key, str) else derived_key
+
         secret_key = getattr(settings, 'ENCRYPTION_KEY')
-        # Generate a key from the secret
-        password = secret_key.encode()
-        salt = b'salt_1234567890'  # In production, use a random salt per installation
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(password))
-        self.cipher_suite = Fernet(key)
+        salt = getattr(settings, 'ENCRYPTION_SALT', None) or KDF_SALT
+        if isinstance(salt, str):
+            salt = salt.encode()
+        cache_path = getattr(settings, 'ENCRYPTION_KEY_CACHE', None)
+        if not cache_path:
+            return derive_fernet_key(secret_key, salt)
+
+        # The cache entry is only valid for the same secret and KDF parameters
+        fingerprint = hashlib.sha256(
+            b'%d:' % KDF_ITERATIONS + salt + b':' + secret_key.encode()
+        ).hexdigest()
+        try:
+            with open(cache_path) as f:
+                cached_fingerprint, cached_key = f.read().split()
+            if cached_fingerprint == fingerprint:
+                return cached_key.encode()
+        except (OSError, ValueError):
+            pass
+
+        key = derive_fernet_key(secret_key, salt)
+        try:
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(f'{fingerprint} {key.decode()}\n')
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # Caching is an optimisation only; a read-only filesystem is fine
+            pass
+        return key
+
+    def primary_key_id(self):
+        """Short, non-secret identifier of the primary key"""
+        return hashlib.sha256(self.load_key()).hexdigest()[:12]
     
     def encrypt(self, text):
         """Encrypt text and return base64 encoded string"""
@@ -33,60 +245,412 @@ class EncryptionManager:
             return text
         encrypted_text = self.cipher_suite.encrypt(text.encode())
         return base64.urlsafe_b64encode(encrypted_text).decode()
+
+    def encrypt_compact(self, text):
+        """Encrypt text and return version-tagged raw token bytes"""
+        return compact_encrypt_with(self.cipher_suite, text)
+
+    def seal(self, value):
+        """Pickle and encrypt a value kept outside the database, e.g. in a shared cache"""
+        return self.cipher_suite.encrypt(pickle.dumps(value))
+
+    def unseal(self, token):
+        """The value of a seal() token; raises InvalidToken if it was altered or made with another key"""
+        return pickle.loads(self.cipher_suite.decrypt(token))
+
+    def rotate(self, stored):
+        """Re-encrypt a stored value under the newest key, in the compact format"""
+        return rotate_with(self.cipher_suite, stored)
+
+    def to_compact(self, stored):
+        """
+        Convert a stored value to the compact format. Legacy ciphertexts are
+        only re-encoded, not decrypted; unencrypted legacy text is encrypted.
+        """
+        if not stored or is_compact(stored):
+            return stored
+        raw = _legacy_token_bytes(stored)
+        if not raw:
+            return self.encrypt_compact(stored)
+        return COMPACT_FORMAT_V1 + raw
     
     def decrypt(self, encrypted_text):
-        """Decrypt base64 encoded string and return original text"""
+        """Decrypt a stored value (compact bytes or legacy base64 string) and return original text"""
         if not encrypted_text:
             return encrypted_text
+        return self.decrypt_many([encrypted_text])[0]
+
+    def decrypt_many(self, encrypted_texts):
+        """
+        Decrypt a batch of stored values. Each distinct ciphertext is decrypted
+        at most once and recently seen ones are served from the LRU cache.
+        """
+        results = [None] * len(encrypted_texts)
+        pending = {}
+        for index, encrypted_text in enumerate(encrypted_texts):
+            if not encrypted_text:
+                results[index] = encrypted_text
+                continue
+            key = self.cache.key(encrypted_text)
+            if key in pending:
+                pending[key][1].append(index)
+                continue
+            plaintext = self.cache.get(key)
+            if plaintext is None:
+                pending[key] = (encrypted_text, [index])
+            else:
+                results[index] = plaintext
+
+        if pending:
+            started = time.perf_counter()
+            for key, (encrypted_text, indexes) in pending.items():
+                plaintext = self._decrypt(encrypted_text)
+                self.cache.put(key, plaintext)
+                for index in indexes:
+                    results[index] = plaintext
+            self.cache.record_time(time.perf_counter() - started)
+        return results
+
+    def _decrypt(self, encrypted_text):
         try:
-            decoded_text = base64.urlsafe_b64decode(encrypted_text.encode())
-            decrypted_text = self.cipher_suite.decrypt(decoded_text)
+            decrypted_text = self.cipher_suite.decrypt(_token_from_stored(encrypted_text))
             return decrypted_text.decode()
         except Exception as e:
             # If decryption fails, return original (might be unencrypted legacy data)
             return encrypted_text
 
+    def stats(self):
+        """Cache hit/miss counters and time spent decrypting"""
+        return self.cache.stats()
+
 # Global instance
 encryption_manager = EncryptionManager()
 
-class EncryptedTextField(models.TextField):
-    """Custom TextField that automatically encrypts/decrypts data"""
-    
+
+# Process pool for bulk crypto work. Workers get the key material once through
+# the initializer and never need Django settings or a database connection.
+_worker_cipher = None
+
+
+def _init_crypto_worker(keys):
+    global _worker_cipher
+    _worker_cipher = MultiFernet([Fernet(key) for key in keys])
+
+
+def _rotate_values(values):
+    return [rotate_with(_worker_cipher, value) for value in values]
+
+
+def _encrypt_values(texts):
+    return [compact_encrypt_with(_worker_cipher, text) for text in texts]
+
+
+def crypto_pool(workers):
+    """ProcessPoolExecutor whose workers hold the active encryption keys"""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_crypto_worker,
+        initargs=(encryption_manager.keys(),),
+    )
+
+
+def _split(values, parts):
+    size = max(1, -(-len(values) // parts))
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def _pool_map(pool, func, values, parts):
+    results = []
+    for chunk in pool.map(func, _split(values, parts)):
+        results.extend(chunk)
+    return results
+
+
+def rotate_values(values, pool=None, workers=1):
+    """Re-encrypt stored values under the newest key, optionally across a crypto_pool"""
+    if pool is None:
+        return [encryption_manager.rotate(value) for value in values]
+    return _pool_map(pool, _rotate_values, values, workers)
+
+
+def encrypt_values(texts, pool=None, workers=1):
+    """Encrypt texts into the compact format, optionally across a crypto_pool"""
+    if pool is None:
+        return [encryption_manager.encrypt_compact(text) for text in texts]
+    return _pool_map(pool, _encrypt_values, texts, workers)
+
+
+def is_compact(stored):
+    return isinstance(stored, bytes) and stored[:1] == COMPACT_FORMAT_V1
+
+
+def normalize_stored_value(value):
+    """
+    Bring a raw column value into one of the two stored formats: compact bytes
+    or a legacy base64 string (binary columns hand legacy values back as bytes)
+    """
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, bytes) and not is_compact(value):
+        value = value.decode()
+    return value
+
+# How encrypted fields treat values while rows are being loaded. Outside of
+# BatchDecryptIterable/LazyDecryptIterable/stored_values() every value is
+# decrypted eagerly.
+BATCH = 'batch'
+LAZY = 'lazy'
+_decryption_mode = contextvars.ContextVar('decryption_mode', default=None)
+
+
+@contextmanager
+def stored_values():
+    """Load encrypted fields as undecrypted Ciphertext values while active"""
+    token = _decryption_mode.set(BATCH)
+    try:
+        yield
+    finally:
+        _decryption_mode.reset(token)
+
+
+class Ciphertext:
+    """A stored value that has been loaded but not decrypted yet"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return '<Ciphertext>'
+
+
+class LazyPlaintext:
+    """
+    Stands in for a decrypted value and only decrypts it the first time it is
+    used as a string. Saving an instance whose value was never replaced
+    writes the original ciphertext back untouched.
+    """
+    __slots__ = ('ciphertext', '_plaintext')
+
+    def __init__(self, ciphertext):
+        self.ciphertext = ciphertext
+        self._plaintext = None
+
+    @property
+    def is_decrypted(self):
+        return self._plaintext is not None
+
+    def __str__(self):
+        if self._plaintext is None:
+            self._plaintext = encryption_manager.decrypt(self.ciphertext)
+        return self._plaintext
+
+    def __bool__(self):
+        # Empty values are stored as-is, so this needs no decryption
+        return bool(self.ciphertext)
+
+    def __len__(self):
+        return len(str(self))
+
+    def __eq__(self, other):
+        if isinstance(other, LazyPlaintext):
+            other = str(other)
+        return str(self) == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __contains__(self, item):
+        return item in str(self)
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __getitem__(self, key):
+        return str(self)[key]
+
+    def __add__(self, other):
+        return str(self) + other
+
+    def __radd__(self, other):
+        return other + str(self)
+
+    def __getattr__(self, name):
+        # Delegate str methods (lower(), split(), ...) to the plaintext
+        return getattr(str(self), name)
+
+    def __repr__(self):
+        return '<LazyPlaintext %s>' % ('decrypted' if self.is_decrypted else 'pending')
+
+
+def _pending_ciphertexts(instance, seen):
+    if id(instance) in seen:
+        return
+    seen.add(id(instance))
+    for attname, value in instance.__dict__.items():
+        if isinstance(value, Ciphertext):
+            yield instance, attname, value
+    # Rows pulled in through select_related() are decrypted in the same batch
+    for related in instance._state.fields_cache.values():
+        if isinstance(related, models.Model):
+            yield from _pending_ciphertexts(related, seen)
+
+
+def decrypt_instances(instances):
+    """Decrypt every pending encrypted field on the given model instances in one batch"""
+    seen = set()
+    pending = [item for instance in instances for item in _pending_ciphertexts(instance, seen)]
+    plaintexts = encryption_manager.decrypt_many([ciphertext.value for _, _, ciphertext in pending])
+    for (instance, attname, _), plaintext in zip(pending, plaintexts):
+        setattr(instance, attname, plaintext)
+
+
+class DeferredDecryptIterable(ModelIterable):
+    """Loads model instances a chunk at a time with the given decryption mode"""
+    mode = None
+
+    def __iter__(self):
+        rows = super().__iter__()
+        while True:
+            token = _decryption_mode.set(self.mode)
+            try:
+                chunk = list(islice(rows, self.chunk_size))
+            finally:
+                _decryption_mode.reset(token)
+            if not chunk:
+                return
+            self.prepare(chunk)
+            yield from chunk
+
+    def prepare(self, chunk):
+        pass
+
+
+class BatchDecryptIterable(DeferredDecryptIterable):
+    """Yields model instances whose encrypted fields are decrypted a chunk at a time"""
+    mode = BATCH
+
+    def prepare(self, chunk):
+        decrypt_instances(chunk)
+
+
+class LazyDecryptIterable(DeferredDecryptIterable):
+    """Yields model instances whose encrypted fields hold LazyPlaintext proxies"""
+    mode = LAZY
+
+
+class EncryptedQuerySet(models.QuerySet):
+    """QuerySet for models with encrypted fields"""
+
+    def batch_decrypt(self):
+        """Decrypt encrypted fields per chunk of rows instead of per field per row"""
+        return self._with_iterable(BatchDecryptIterable)
+
+    def lazy_decrypt(self):
+        """Only decrypt encrypted fields when they are actually used as strings"""
+        return self._with_iterable(LazyDecryptIterable)
+
+    def _with_iterable(self, iterable_class):
+        # values()/values_list() querysets keep decrypting eagerly
+        if not issubclass(self._iterable_class, ModelIterable):
+            return self
+        clone = self._chain()
+        clone._iterable_class = iterable_class
+        return clone
+
+
+class LegacyFallbackCol(Col):
+    """Column read as COALESCE(column, legacy column) of the same table"""
+
+    def as_sql(self, compiler, connection):
+        sql, params = super().as_sql(compiler, connection)
+        identifiers = (self.alias, self.target.legacy_column) if self.alias else (self.target.legacy_column,)
+        legacy = '.'.join(map(compiler.quote_name_unless_alias, identifiers))
+        return f'COALESCE({sql}, {legacy})', params
+
+
+class EncryptedFieldMixin:
+    """
+    Automatically encrypts data on the way in and decrypts it on the way out.
+    With compact=True values are written in the compact binary format to a
+    binary column; both formats are always readable.
+
+    legacy_column names an older column of the same table that still holds
+    values for rows whose own column is NULL. Reads fall back to it while
+    writes only go to the new column, so a column can be replaced without
+    rewriting the table in the migration (see backfill.py).
+    """
+
+    def __init__(self, *args, compact=False, legacy_column=None, **kwargs):
+        self.compact = compact
+        self.legacy_column = legacy_column
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.compact:
+            kwargs['compact'] = True
+        if self.legacy_column:
+            kwargs['legacy_column'] = self.legacy_column
+        return name, path, args, kwargs
+
+    def get_col(self, alias, output_field=None):
+        if self.legacy_column is None:
+            return super().get_col(alias, output_field)
+        return LegacyFallbackCol(alias, self, output_field)
+
+    def get_internal_type(self):
+        if self.compact:
+            return 'BinaryField'
+        return super().get_internal_type()
+
     def from_db_value(self, value, expression, connection):
         if value is None:
             return value
+        value = normalize_stored_value(value)
+        mode = _decryption_mode.get()
+        if mode == BATCH:
+            return Ciphertext(value)
+        if mode == LAZY:
+            return LazyPlaintext(value)
         # Decrypt when reading from database
         return encryption_manager.decrypt(value)
-    
+
     def to_python(self, value):
         if value is None:
             return value
         # For form data, just return as-is
         return value
-    
+
     def get_prep_value(self, value):
         if value is None:
             return value
+        if isinstance(value, Ciphertext):
+            # Already in stored form (maintenance commands, bulk loads)
+            return value.value
+        if isinstance(value, LazyPlaintext):
+            # Unchanged since it was loaded, so the stored ciphertext is still valid
+            return value.ciphertext
         # Encrypt when saving to database
+        if self.compact:
+            return encryption_manager.encrypt_compact(value)
         return encryption_manager.encrypt(value)
 
-class EncryptedCharField(models.CharField):
+
+class EncryptedTextField(EncryptedFieldMixin, models.TextField):
+    """Custom TextField that automatically encrypts/decrypts data"""
+
+
+class EncryptedCharField(EncryptedFieldMixin, models.CharField):
     """Custom CharField that automatically encrypts/decrypts data"""
-    
-    def from_db_value(self, value, expression, connection):
-        if value is None:
-            return value
-        # Decrypt when reading from database
-        return encryption_manager.decrypt(value)
-    
-    def to_python(self, value):
-        if value is None:
-            return value
-        # For form data, just return as-is
-        return value
-    
-    def get_prep_value(self, value):
-        if value is None:
-            return value
-        # Encrypt when saving to database
-        return encryption_manager.encrypt(value)
\ No newline at end of file
+
+
+def encrypted_fields(model):
+    """Concrete encrypted fields of a model"""
+    return [f for f in model._meta.concrete_fields if isinstance(f, EncryptedFieldMixin)]
+
+
+def legacy_fields(model):
+    """Concrete fields holding the legacy columns that encrypted fields fall back to"""
+    columns = {f.legacy_column for f in encrypted_fields(model) if f.legacy_column}
+    return [f for f in model._meta.concrete_fields if f.column in columns and not isinstance(f, EncryptedFieldMixin)]
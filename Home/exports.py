@@ -0,0 +1,309 @@
+"""
+Complaint report exports
+
+The PDF report is produced as a stream: rows are read in keyset chunks
+(pagination.iter_keyset), wrapped and packed into a table that fits exactly
+one page, and each finished page is compressed and written out straight
+away. A row taller than the space left on a page is split, its remaining
+lines continuing at the top of the next page, so no text is dropped. Only
+the current page's rows and the list of page object numbers are held, so
+memory stays flat however many complaints match. Reports are built by
+background jobs (reports.py).
+
+The report only needs filled rectangles, grid lines and text in the two
+standard Helvetica fonts, so PdfStreamWriter serialises those directly;
+reportlab provides the font metrics.
+
+CSV and NDJSON exports work the same way for analysts: the header goes out
+before the query runs, then rows are read and batch-decrypted a chunk at a
+time and sent EXPORT_ROWS_PER_WRITE rows per write.
+"""
+import csv
+import textwrap
+import zlib
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from .pagination import iter_keyset
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+# Columns loaded for the report; the remaining encrypted and text fields stay in the database
+PDF_FIELDS = ('id', 'user__username', 'name', 'division', 'complaint', 'complaint_date', 'status', 'priority')
+
+PDF_HEADER = ["ID", "User", "Name", "Division", "Complaint", "Date & Time", "Status", "Priority"]
+PDF_COL_WIDTHS = [30, 60, 70, 60, 120, 80, 60, 50]
+PDF_MARGIN = 72
+
+# A row is only split over two pages if at least this many of its lines fit on the first
+MIN_SPLIT_LINES = 3
+HEADER_FONT, HEADER_SIZE, HEADER_HEIGHT = 'Helvetica-Bold', 10, 27
+BODY_FONT, BODY_SIZE, BODY_LEADING = 'Helvetica', 8, 10
+TOP_PADDING = 3
+CELL_PADDING = 6  # top + bottom
+
+
+class PdfStreamWriter:
+    """
+    Minimal PDF serialiser that emits every page as soon as it is finished.
+    Each method returns the bytes to write next; page() takes the content
+    stream of one page, drawn with /F1 (Helvetica) and /F2 (Helvetica-Bold).
+    """
+    # Reserved object numbers; the page tree is written last, once all pages are known
+    CATALOG, PAGES, REGULAR_FONT, BOLD_FONT = 1, 2, 3, 4
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+        self.offset = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 5
+
+    def _object(self, number, body):
+        self.offsets[number] = self.offset
+        data = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+        self.offset += len(data)
+        return data
+
+    def start(self):
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.offset = len(header)
+        fonts = b''.join(
+            self._object(number, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % name)
+            for number, name in ((self.REGULAR_FONT, b'Helvetica'), (self.BOLD_FONT, b'Helvetica-Bold'))
+        )
+        return header + fonts
+
+    def page(self, content):
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        stream = zlib.compress(content)
+        width, height = self.page_size
+        return self._object(
+            content_id,
+            b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(stream) + stream + b'\nendstream',
+        ) + self._object(
+            page_id,
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] /Contents %d 0 R '
+            b'/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> >>'
+            % (self.PAGES, _num(width), _num(height), content_id, self.REGULAR_FONT, self.BOLD_FONT),
+        )
+
+    def finish(self):
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.page_ids)
+        data = self._object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.page_ids)))
+        data += self._object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+        xref = [b'xref\n0 %d\n' % self.next_id, b'0000000000 65535 f \n']
+        xref += [b'%010d 00000 n \n' % self.offsets[number] for number in range(1, self.next_id)]
+        trailer = b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            self.next_id, self.CATALOG, self.offset)
+        return data + b''.join(xref) + trailer
+
+
+def _num(value):
+    return ('%.2f' % value).rstrip('0').rstrip('.').encode()
+
+
+def _rgb(color):
+    return b'%s %s %s' % (_num(color.red), _num(color.green), _num(color.blue))
+
+
+def _text(value):
+    # Standard fonts only cover WinAnsi; anything else is shown as '?'
+    data = value.encode('cp1252', 'replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _wrap(text, width):
+    """Text wrapped to width"""
+    if not text:
+        return []
+    return textwrap.wrap(str(text), width)
+
+
+def _row_height(cells):
+    return (max(len(cell) for cell in cells) or 1) * BODY_LEADING + CELL_PADDING
+
+
+def _pdf_row(complaint):
+    """Cell lines of one complaint"""
+    return [
+        [str(complaint.id)],
+        [complaint.user.username],
+        _wrap(complaint.name, 25),
+        _wrap(complaint.division, 20),
+        _wrap(complaint.complaint, 25),
+        [complaint.complaint_date.strftime('%Y-%m-%d %H:%M')],
+        [complaint.get_status_display()],
+        [complaint.get_priority_display()],
+    ]
+
+
+def _page_content(rows, heights, page_size):
+    """Content stream of one page: the header row and rows, centred in a full grid"""
+    page_width, page_height = page_size
+    table_width = sum(PDF_COL_WIDTHS)
+    left = (page_width - table_width) / 2
+    top = page_height - PDF_MARGIN
+    body_top = top - HEADER_HEIGHT
+    bottom = body_top - sum(heights)
+    ops = []
+
+    # Backgrounds
+    ops.append(b'%s rg %s %s %s %s re f' % (_rgb(colors.cyan), _num(left), _num(body_top), _num(table_width), _num(HEADER_HEIGHT)))
+    if rows:
+        ops.append(b'%s rg %s %s %s %s re f' % (_rgb(colors.beige), _num(left), _num(bottom), _num(table_width), _num(body_top - bottom)))
+
+    # Grid
+    ops.append(b'0 0 0 RG 1 w')
+    y = top
+    for height in [HEADER_HEIGHT] + heights + [0]:
+        ops.append(b'%s %s m %s %s l S' % (_num(left), _num(y), _num(left + table_width), _num(y)))
+        y -= height
+    x = left
+    for width in PDF_COL_WIDTHS + [0]:
+        ops.append(b'%s %s m %s %s l S' % (_num(x), _num(top), _num(x), _num(bottom)))
+        x += width
+
+    # Text, centred in each cell and top aligned
+    ops.append(b'0 0 0 rg')
+
+    def cell_text(lines, x, row_top, font, font_id, size, leading):
+        for i, line in enumerate(lines):
+            text_x = x - stringWidth(line, font, size) / 2
+            baseline = row_top - TOP_PADDING - size - i * leading
+            ops.append(b'BT /F%d %d Tf %s %s Td (%s) Tj ET' % (font_id, size, _num(text_x), _num(baseline), _text(line)))
+
+    def centres():
+        x = left
+        for width in PDF_COL_WIDTHS:
+            yield x + width / 2
+            x += width
+
+    for centre, title in zip(centres(), PDF_HEADER):
+        cell_text([title], centre, top, HEADER_FONT, 2, HEADER_SIZE, HEADER_SIZE * 1.2)
+    row_top = body_top
+    for cells, height in zip(rows, heights):
+        for centre, lines in zip(centres(), cells):
+            cell_text(lines, centre, row_top, BODY_FONT, 1, BODY_SIZE, BODY_LEADING)
+        row_top -= height
+    return b'\n'.join(ops)
+
+
+def iter_complaints_pdf(complaints, chunk_size=None, progress=None):
+    """
+    Yield the complaints report as PDF bytes, one page at a time. progress,
+    if given, is called with the number of rows drawn after every chunk.
+    """
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 500)
+    page_size = letter
+    available = page_size[1] - 2 * PDF_MARGIN
+    writer = PdfStreamWriter(page_size)
+    yield writer.start()
+
+    rows, heights = [], []
+    used = HEADER_HEIGHT
+    for count, complaint in enumerate(iter_keyset(complaints.only(*PDF_FIELDS), chunk_size), 1):
+        if progress and count % chunk_size == 0:
+            progress(count)
+        cells = _pdf_row(complaint)
+        while cells:
+            lines = max(len(cell) for cell in cells) or 1
+            fit = int((available - used - CELL_PADDING) // BODY_LEADING)
+            if lines > fit and rows and fit < min(lines, MIN_SPLIT_LINES):
+                # Too little room left to start this row here
+                yield writer.page(_page_content(rows, heights, page_size))
+                rows, heights = [], []
+                used = HEADER_HEIGHT
+                continue
+            # The lines that fit; the rest continue on the next page
+            part = [cell[:fit] for cell in cells]
+            cells = [cell[fit:] for cell in cells] if lines > fit else None
+            rows.append(part)
+            heights.append(_row_height(part))
+            used += heights[-1]
+            if cells:
+                yield writer.page(_page_content(rows, heights, page_size))
+                rows, heights = [], []
+                used = HEADER_HEIGHT
+    # The last page, or a header-only page for an empty report
+    yield writer.page(_page_content(rows, heights, page_size))
+    yield writer.finish()
+
+
+def write_complaints_pdf(complaints, out, chunk_size=None, progress=None):
+    """Write the complaints report to the binary file out"""
+    for data in iter_complaints_pdf(complaints, chunk_size, progress):
+        out.write(data)
+
+
+class _Echo:
+    """File-like object for csv.writer that returns what is written"""
+    def write(self, value):
+        return value
+
+
+def _batched(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def _rows(objects, columns, chunk_size):
+    # objects are read newest first in keyset chunks, so they must load complaint_date and id
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 500)
+    for obj in iter_keyset(objects, chunk_size):
+        yield [value(obj) for _, value in columns]
+
+
+def iter_csv(objects, columns, chunk_size=None):
+    """
+    Yield objects as CSV: a header of column names, then one line per object.
+    columns is a list of (name, function returning the value for an object).
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in columns])
+
+    def lines():
+        for row in _rows(objects, columns, chunk_size):
+            yield writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+    yield from _batched(lines(), getattr(settings, 'EXPORT_ROWS_PER_WRITE', 100))
+
+
+def iter_ndjson(objects, columns, chunk_size=None):
+    """Yield objects as newline-delimited JSON, one object per line (columns as for iter_csv)"""
+    names = [name for name, _ in columns]
+    encoder = DjangoJSONEncoder()
+
+    def lines():
+        for row in _rows(objects, columns, chunk_size):
+            yield encoder.encode(dict(zip(names, row))) + '\n'
+    yield from _batched(lines(), getattr(settings, 'EXPORT_ROWS_PER_WRITE', 100))
+
+
+# format -> (content type, generator)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', iter_csv),
+    'ndjson': ('application/x-ndjson', iter_ndjson),
+}
+
+
+def export_response(objects, columns, fmt, filename):
+    """StreamingHttpResponse sending objects in one of EXPORT_FORMATS while they are read"""
+    content_type, iterate = EXPORT_FORMATS[fmt]
+    response = StreamingHttpResponse(iterate(objects, columns), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
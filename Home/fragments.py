@@ -0,0 +1,76 @@
+"""
+Versioned cache of rendered page fragments
+
+Entries are keyed by the complaint DataVersion plus the request parameters
+that shape the fragment. Every committed write bumps the version, so older
+entries are simply never looked up again and expire on their own; nothing
+has to be invalidated key by key.
+
+Fragments contain decrypted complaint data, so they are stored encrypted
+with the same keys as the database fields: a shared cache (Redis,
+Memcached) never holds the plaintext of encrypted-at-rest fields.
+"""
+import hashlib
+from cryptography.fernet import InvalidToken
+from django.conf import settings
+from django.core.cache import cache
+from .encryption import encryption_manager
+from .versioning import current_version
+
+
+class FragmentCache:
+    """Read-through cache for one kind of fragment, with shared hit/miss counters"""
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self._timeout = timeout
+
+    @property
+    def timeout(self):
+        return self._timeout or getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 300)
+
+    def key(self, version, params):
+        digest = hashlib.sha256(repr(sorted(params.items())).encode()).hexdigest()[:32]
+        return f'fragment:{self.name}:{version}:{digest}'
+
+    def get_or_build(self, params, build):
+        """Return the cached fragment for params, building and storing it on a miss"""
+        # Read the version before the data: a fragment built concurrently with
+        # a write is then at least as new as the version it is stored under
+        key = self.key(current_version(), params)
+        sealed = cache.get(key)
+        if sealed is not None:
+            try:
+                value = encryption_manager.unseal(sealed)
+            except InvalidToken:
+                # Stored under a key that has been rotated out; rebuilt below
+                pass
+            else:
+                self._count('hits')
+                return value
+        self._count('misses')
+        value = build()
+        cache.set(key, encryption_manager.seal(value), self.timeout)
+        return value
+
+    def _count(self, outcome):
+        key = f'fragment-stats:{self.name}:{outcome}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            # First count, or evicted; another process may add it meanwhile
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+    def stats(self):
+        counts = cache.get_many([f'fragment-stats:{self.name}:hits', f'fragment-stats:{self.name}:misses'])
+        hits = counts.get(f'fragment-stats:{self.name}:hits', 0)
+        misses = counts.get(f'fragment-stats:{self.name}:misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': (hits / (hits + misses)) if hits + misses else 0.0,
+        }
+
+
+admin_panel_cache = FragmentCache('admin_panel')
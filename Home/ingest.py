@@ -0,0 +1,217 @@
+"""
+Bulk loading of complaints from CSV or NDJSON
+
+Rows are read as a stream and written in batches: names, complaint texts and
+previews of a whole batch are encrypted together (optionally across a
+process pool), ids are reserved as one block, and the complaints, their
+search tokens and their initial ComplaintUpdate rows are each inserted with
+a single bulk_create.
+
+Recognised columns: username (required), complaint (required), name,
+division, category (name), priority, status, complaint_date (ISO 8601).
+Missing name/division default to the student's name and profile division.
+"""
+import csv
+import json
+import time
+from itertools import islice
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .categories import category_cache
+from .encryption import Ciphertext, crypto_pool, encrypt_values
+from .models import Complaint, ComplaintSearchToken, ComplaintUpdate, complaint_ids
+from .search import build_search_tokens
+
+FORMATS = ('csv', 'ndjson')
+
+
+class IngestError(ValueError):
+    """A row that can't be turned into a complaint"""
+
+
+def read_rows(stream, fmt):
+    """
+    Yield one record per CSV row (a dict) or NDJSON line (its unparsed text,
+    so a malformed line is reported as a skipped record like any other)
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'ndjson':
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield line
+    else:
+        raise ValueError(f'Unknown format {fmt!r}, expected one of {", ".join(FORMATS)}')
+
+
+def _parse(record):
+    """A record as a dict of strings"""
+    if isinstance(record, (str, bytes)):
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            raise IngestError(f'invalid JSON: {e}')
+    if not isinstance(record, dict):
+        raise IngestError(f'expected an object, got {type(record).__name__}')
+    return {key: '' if value is None else str(value) for key, value in record.items()}
+
+
+class _Lookups:
+    """Users and categories referenced by the input, cached across batches"""
+
+    def __init__(self):
+        self.users = {}
+        self.categories = {category.name.casefold(): category.id for category in category_cache.all()}
+
+    def load_users(self, usernames):
+        missing = set(usernames) - set(self.users)
+        if missing:
+            for user in User.objects.filter(username__in=missing).select_related('profile'):
+                self.users[user.username] = user
+
+
+def _clean(record, lookups):
+    username = (record.get('username') or '').strip()
+    user = lookups.users.get(username)
+    if user is None:
+        raise IngestError(f'unknown user {username!r}')
+
+    text = (record.get('complaint') or '').strip()
+    if not text:
+        raise IngestError('complaint text is empty')
+
+    priority = (record.get('priority') or 'medium').strip()
+    if priority not in dict(Complaint.PRIORITY_CHOICES):
+        raise IngestError(f'invalid priority {priority!r}')
+    status = (record.get('status') or 'pending').strip()
+    if status not in dict(Complaint.STATUS_CHOICES):
+        raise IngestError(f'invalid status {status!r}')
+
+    category_id = None
+    category = (record.get('category') or '').strip()
+    if category:
+        category_id = lookups.categories.get(category.casefold())
+        if category_id is None:
+            raise IngestError(f'unknown category {category!r}')
+
+    complaint_date = timezone.now()
+    if record.get('complaint_date'):
+        try:
+            # None if malformed; ValueError if well formed but out of range (month 13)
+            complaint_date = parse_datetime(record['complaint_date'])
+        except ValueError:
+            complaint_date = None
+        if complaint_date is None:
+            raise IngestError(f'invalid complaint_date {record["complaint_date"]!r}')
+        if timezone.is_naive(complaint_date):
+            complaint_date = timezone.make_aware(complaint_date)
+
+    profile = getattr(user, 'profile', None)
+    return {
+        'user': user,
+        'name': (record.get('name') or '').strip() or (user.first_name or '').strip() or user.username,
+        'division': (record.get('division') or '').strip() or (profile.division if profile else ''),
+        'complaint': text,
+        'category_id': category_id,
+        'priority': priority,
+        'status': status,
+        'complaint_date': complaint_date,
+    }
+
+
+def _write_batch(rows, imported_by, pool, workers):
+    names = [row['name'] for row in rows]
+    texts = [row['complaint'] for row in rows]
+    previews = [Complaint.build_preview(text) for text in texts]
+    encrypted = encrypt_values(names + texts + previews, pool=pool, workers=workers)
+    count = len(rows)
+
+    complaints = []
+    for i, row in enumerate(rows):
+        complaints.append(Complaint(
+            user=row['user'],
+            name=Ciphertext(encrypted[i]),
+            division=row['division'],
+            complaint=Ciphertext(encrypted[count + i]),
+            preview=Ciphertext(encrypted[2 * count + i]),
+            category_id=row['category_id'],
+            status=row['status'],
+            priority=row['priority'],
+            complaint_date=row['complaint_date'],
+            resolved_date=row['complaint_date'] if row['status'] == 'resolved' else None,
+        ))
+
+    # Reserved before the transaction, so the IdSequence row isn't locked until the batch commits
+    for complaint, pk in zip(complaints, complaint_ids.allocate(count)):
+        complaint.pk = pk
+
+    with transaction.atomic():
+        Complaint.objects.bulk_create(complaints)
+        tokens = []
+        for complaint, name, text in zip(complaints, names, texts):
+            tokens.extend(build_search_tokens(complaint, {'name': name, 'complaint': text}))
+        ComplaintSearchToken.objects.bulk_create(tokens, batch_size=1000)
+        ComplaintUpdate.objects.bulk_create([
+            ComplaintUpdate(
+                complaint=complaint,
+                updated_by=imported_by,
+                old_status='',
+                new_status=complaint.status,
+                update_message='Imported',
+                updated_at=complaint.complaint_date,
+            )
+            for complaint in complaints
+        ])
+    return complaints
+
+
+def ingest_complaints(records, imported_by, batch_size=500, workers=1, progress=None):
+    """
+    Create complaints from an iterable of records (dicts, or NDJSON lines as
+    yielded by read_rows). Invalid records are skipped and reported.
+    progress, if given, is called with the running result after every
+    batch. Returns a dict with created/skipped counts, errors
+    (record number, message), elapsed seconds and rows_per_second.
+    """
+    result = {'created': 0, 'skipped': 0, 'errors': [], 'seconds': 0.0, 'rows_per_second': 0.0}
+    lookups = _Lookups()
+    records = iter(enumerate(records, start=1))
+    pool = crypto_pool(workers) if workers > 1 else None
+    started = time.monotonic()
+    try:
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+
+            parsed = []
+            for number, record in batch:
+                try:
+                    parsed.append((number, _parse(record)))
+                except IngestError as e:
+                    result['skipped'] += 1
+                    result['errors'].append((number, str(e)))
+            lookups.load_users((record.get('username') or '').strip() for _, record in parsed)
+
+            rows = []
+            for number, record in parsed:
+                try:
+                    rows.append(_clean(record, lookups))
+                except IngestError as e:
+                    result['skipped'] += 1
+                    result['errors'].append((number, str(e)))
+            if rows:
+                _write_batch(rows, imported_by, pool, workers)
+                result['created'] += len(rows)
+
+            result['seconds'] = time.monotonic() - started
+            result['rows_per_second'] = result['created'] / max(result['seconds'], 1e-6)
+            if progress:
+                progress(result)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return result
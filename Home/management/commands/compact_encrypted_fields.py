@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from Home.backfill import rewrite_encrypted_fields
+from Home.encryption import encryption_manager
+from Home.models import Complaint
+
+
+class Command(BaseCommand):
+    help = 'Rewrite encrypted complaint fields from the legacy base64 format to the compact binary format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of complaints rewritten per transaction')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between chunks to limit load')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the saved checkpoint and start from the first complaint')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        processed = 0
+
+        def transform(values):
+            return [None if value is None else encryption_manager.to_compact(value) for value in values]
+
+        def progress(checkpoint, rows):
+            nonlocal processed
+            processed += rows
+            rate = processed / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'Processed {checkpoint.rows_done} complaints (up to #{checkpoint.last_pk}, {rate:.0f} rows/s)')
+
+        checkpoint = rewrite_encrypted_fields(
+            Complaint, 'compact_encrypted_fields', transform,
+            chunk_size=options['chunk_size'], restart=options['restart'],
+            pause=options['pause'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Compact format applied to {checkpoint.rows_done} complaints'))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from Home.encryption import KDF_SALT, derive_fernet_key
+
+
+class Command(BaseCommand):
+    help = (
+        'Print the Fernet key derived from ENCRYPTION_KEY, for use as ENCRYPTION_DERIVED_KEY '
+        'or as an entry of ENCRYPTION_RETIRED_KEYS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--secret', help='Secret to derive from (defaults to ENCRYPTION_KEY)')
+        parser.add_argument('--salt', help='Salt to derive with (defaults to ENCRYPTION_SALT)')
+
+    def handle(self, *args, **options):
+        secret_key = options['secret'] or getattr(settings, 'ENCRYPTION_KEY', None)
+        if not secret_key:
+            raise CommandError('ENCRYPTION_KEY is not set.')
+        salt = options['salt'] or getattr(settings, 'ENCRYPTION_SALT', None) or KDF_SALT
+        if isinstance(salt, str):
+            salt = salt.encode()
+        self.stdout.write(derive_fernet_key(secret_key, salt).decode())
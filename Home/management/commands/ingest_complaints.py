@@ -0,0 +1,51 @@
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from Home.ingest import FORMATS, ingest_complaints, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk load complaints from a CSV or NDJSON file ("-" reads standard input)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - for standard input')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format (defaults to the file extension)')
+        parser.add_argument('--imported-by', required=True,
+                            help='Username recorded as the author of the initial ComplaintUpdate rows')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of complaints written per bulk insert')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes used for encryption (1 = in-process)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+        try:
+            imported_by = User.objects.get(username=options['imported_by'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["imported_by"]}" does not exist.')
+
+        def progress(result):
+            self.stdout.write(
+                f'{result["created"]} created, {result["skipped"]} skipped '
+                f'({result["rows_per_second"]:.0f} rows/s)'
+            )
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            result = ingest_complaints(
+                read_rows(stream, fmt), imported_by,
+                batch_size=options['batch_size'], workers=options['workers'], progress=progress,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for number, message in sorted(result['errors']):
+            self.stderr.write(f'Record {number}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result["created"]} complaints in {result["seconds"]:.1f}s '
+            f'({result["rows_per_second"]:.0f} rows/s), skipped {result["skipped"]}'
+        ))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from Home.models import Complaint
+from Home.uploads import IMAGES_AVAILABLE, UploadError, process_upload
+
+# image field -> thumbnail field
+IMAGE_FIELDS = {'complaint_img': 'complaint_thumb', 'action_image': 'action_thumb'}
+
+
+class Command(BaseCommand):
+    help = 'Downscale, strip and thumbnail images uploaded before the upload pipeline existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Complaints loaded per query')
+        parser.add_argument('--keep-originals', action='store_true',
+                            help='Leave the replaced original files in storage')
+
+    def handle(self, *args, **options):
+        if not IMAGES_AVAILABLE:
+            self.stderr.write('Pillow is not installed.')
+            return
+
+        # Images without a thumbnail haven't been through the pipeline yet
+        pending = Q()
+        for image, thumb in IMAGE_FIELDS.items():
+            pending |= ~Q(**{image: ''}) & Q(**{image + '__isnull': False}) & (Q(**{thumb: ''}) | Q(**{thumb + '__isnull': True}))
+        complaints = (
+            Complaint.objects.filter(pending)
+            .only('id', *IMAGE_FIELDS, *IMAGE_FIELDS.values())
+            .order_by('id')
+        )
+
+        processed = skipped = 0
+        for complaint in complaints.iterator(chunk_size=options['batch_size']):
+            changed, replaced = [], []
+            for image_field, thumb_field in IMAGE_FIELDS.items():
+                image = getattr(complaint, image_field)
+                if not image or getattr(complaint, thumb_field):
+                    continue
+                try:
+                    with image.open('rb') as original:
+                        stored, thumbnail = process_upload(original)
+                except (UploadError, OSError) as e:
+                    self.stderr.write(f'Complaint #{complaint.id} {image_field}: {e}')
+                    skipped += 1
+                    continue
+                if thumbnail is None:
+                    # Not an image
+                    continue
+                replaced.append((image.storage, image.name))
+                setattr(complaint, image_field, stored)
+                setattr(complaint, thumb_field, thumbnail)
+                changed += [image_field, thumb_field]
+            if changed:
+                complaint.save(update_fields=changed)
+                processed += 1
+                # Only once the new files are referenced
+                if not options['keep_originals']:
+                    for storage, name in replaced:
+                        storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} complaint(s), {skipped} image(s) skipped'))
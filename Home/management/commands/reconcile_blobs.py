@@ -0,0 +1,22 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from Home.storage import collect_blobs, rebuild_blob_refs
+
+
+class Command(BaseCommand):
+    help = 'Recount attachment blob references and delete blobs that are no longer referenced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=None,
+                            help='Keep unreferenced blobs this long (default: BLOB_GRACE_HOURS)')
+
+    def handle(self, *args, **options):
+        drift = rebuild_blob_refs()
+        for name, delta in sorted(drift.items()):
+            self.stdout.write(f'{name}: {delta:+d}')
+        if drift:
+            self.stdout.write(self.style.WARNING(f'Corrected {len(drift)} reference counts'))
+
+        grace = options['grace_hours']
+        deleted = collect_blobs(None if grace is None else timedelta(hours=grace))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} unreferenced file(s)'))
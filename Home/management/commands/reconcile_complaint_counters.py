@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from Home.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the complaint status counters from the complaint table'
+
+    def handle(self, *args, **options):
+        drift = rebuild_counters()
+        for (status, division, category_key), delta in sorted(drift.items()):
+            self.stdout.write(f'{status} / {division or "-"} / category {category_key or "-"}: {delta:+d}')
+        if drift:
+            self.stdout.write(self.style.WARNING(f'Corrected {len(drift)} counters'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Counters were already correct'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from Home.models import Complaint, ComplaintSearchToken
+from Home.search import build_search_tokens
+from Home.versioning import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the blind search index and list previews for existing complaints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of complaints indexed per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_pk = 0
+        indexed = 0
+
+        # Walk the table in primary-key order so memory use stays flat
+        while True:
+            chunk = list(
+                Complaint.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'name', 'complaint').batch_decrypt()[:chunk_size]
+            )
+            if not chunk:
+                break
+
+            tokens = []
+            for complaint in chunk:
+                tokens.extend(build_search_tokens(complaint))
+                complaint.preview = Complaint.build_preview(complaint.complaint)
+
+            with transaction.atomic():
+                ComplaintSearchToken.objects.filter(complaint__in=chunk).delete()
+                ComplaintSearchToken.objects.bulk_create(tokens, batch_size=1000)
+                Complaint.objects.bulk_update(chunk, ['preview'])
+                bump_version()
+
+            last_pk = chunk[-1].pk
+            indexed += len(chunk)
+            self.stdout.write(f'Indexed {indexed} complaints (up to #{last_pk})')
+
+        self.stdout.write(self.style.SUCCESS(f'Search index and previews rebuilt for {indexed} complaints'))
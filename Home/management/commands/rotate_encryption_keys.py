@@ -0,0 +1,62 @@
+import time
+from django.core.management.base import BaseCommand
+from Home.backfill import rewrite_encrypted_fields
+from Home.encryption import crypto_pool, encryption_manager, rotate_values
+from Home.models import Complaint
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-encrypt complaint data under the newest encryption key. Run after adding the '
+        'previous key to ENCRYPTION_RETIRED_KEYS; remove it from there once this completes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of complaints re-encrypted per transaction')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes used for the encryption work (1 = in-process)')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between chunks to limit load')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the saved checkpoint and start from the first complaint')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        started = time.monotonic()
+        processed = 0
+
+        def progress(checkpoint, rows):
+            nonlocal processed
+            processed += rows
+            rate = processed / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'Re-encrypted {checkpoint.rows_done} complaints (up to #{checkpoint.last_pk}, {rate:.0f} rows/s)')
+
+        # One checkpoint per target key, so a later rotation starts from scratch
+        checkpoint_name = f'rotate_encryption_keys:{encryption_manager.primary_key_id()}'
+        pool = crypto_pool(workers) if workers > 1 else None
+        unreadable = 0
+
+        def transform(values):
+            nonlocal unreadable
+            rotated = rotate_values(values, pool=pool, workers=workers)
+            # Rotation always produces a new token, so an unchanged value is one no active key reads
+            unreadable += sum(1 for old, new in zip(values, rotated) if old and new == old)
+            return rotated
+
+        try:
+            checkpoint = rewrite_encrypted_fields(
+                Complaint, checkpoint_name, transform,
+                chunk_size=options['chunk_size'], restart=options['restart'],
+                pause=options['pause'], progress=progress,
+            )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if unreadable:
+            self.stderr.write(self.style.WARNING(
+                f'{unreadable} values could not be decrypted with any active key and were left unchanged. '
+                'Add the key they were written with to ENCRYPTION_RETIRED_KEYS and run again with --restart.'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{checkpoint.rows_done} complaints are encrypted with the newest key'))
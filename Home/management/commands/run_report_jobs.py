@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand
+from Home.reports import build_report, claim_job, prune_reports
+
+
+class Command(BaseCommand):
+    help = 'Build queued PDF report jobs and prune expired report files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll for new jobs instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to wait between polls of an empty queue (with --loop)')
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        try:
+            while True:
+                job = claim_job()
+                if job is not None:
+                    job = build_report(job)
+                    if job.status == 'done':
+                        built += 1
+                        self.stdout.write(f'Built report {job.key[:12]} ({job.rows_total} rows)')
+                    else:
+                        failed += 1
+                        self.stderr.write(f'Report {job.key[:12]} failed: {job.error}')
+                    continue
+
+                pruned = prune_reports()
+                if pruned:
+                    self.stdout.write(f'Pruned {pruned} expired report(s)')
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Reports done: {built} built, {failed} failed'))
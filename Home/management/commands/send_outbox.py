@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from Home.notifications import flush_notifications
+from Home.outbox import deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Merge pending notifications into emails and deliver the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Emails delivered per SMTP connection')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll for new emails instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to wait between polls of an empty queue (with --loop)')
+
+    def handle(self, *args, **options):
+        totals = {'sent': 0, 'retried': 0, 'failed': 0}
+        try:
+            while True:
+                # Recipients whose coalescing window has passed get their merged email queued first
+                merged = flush_notifications()
+                if merged:
+                    self.stdout.write(f'Queued {merged} coalesced notification email(s)')
+                result = deliver_pending(options['batch_size'])
+                for outcome, count in result.items():
+                    totals[outcome] += count
+                if any(result.values()):
+                    self.stdout.write(f'Sent {result["sent"]}, retrying {result["retried"]}, failed {result["failed"]}')
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Outbox done: {totals["sent"]} sent, {totals["retried"]} to retry, {totals["failed"]} failed'
+        ))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0010_complaint_action_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=20)),
+                ('token', models.BigIntegerField()),
+                ('complaint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='Home.complaint')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['field', 'token', 'complaint'], name='complaint_search_token_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:22
+
+import Home.encryption
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Expand step of the switch to the compact format: the binary columns are
+    added next to the legacy text columns (a nullable ADD COLUMN, which MySQL
+    8 does without copying the table) and the model reads either. Existing
+    rows are moved with `python manage.py compact_encrypted_fields`; the
+    legacy columns are dropped by a later migration once that has completed.
+    """
+
+    dependencies = [
+        ('Home', '0011_complaintsearchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_pk', models.BigIntegerField(default=0)),
+                ('rows_done', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        # The existing columns stay as they are; only the fields are renamed
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(model_name='complaint', name='name'),
+                migrations.RemoveField(model_name='complaint', name='complaint'),
+                migrations.AddField(
+                    model_name='complaint',
+                    name='name_legacy',
+                    field=models.CharField(blank=True, db_column='name', default='', editable=False, max_length=500),
+                ),
+                migrations.AddField(
+                    model_name='complaint',
+                    name='complaint_legacy',
+                    field=models.TextField(blank=True, db_column='complaint', default='', editable=False),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='name',
+            field=Home.encryption.EncryptedCharField(compact=True, db_column='name_compact', legacy_column='name', max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='complaint',
+            field=Home.encryption.EncryptedTextField(compact=True, db_column='complaint_compact', legacy_column='complaint', null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:24
+
+import Home.encryption
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0012_compact_encrypted_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='preview',
+            field=Home.encryption.EncryptedCharField(blank=True, compact=True, editable=False, max_length=500),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+def seed_complaint_sequence(apps, schema_editor):
+    # Continue after the highest existing complaint id, never below 100
+    Complaint = apps.get_model('Home', 'Complaint')
+    IdSequence = apps.get_model('Home', 'IdSequence')
+    last_id = Complaint.objects.aggregate(last=models.Max('id'))['last'] or 0
+    IdSequence.objects.update_or_create(name='complaint', defaults={'next_value': max(last_id + 1, 100)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0013_complaint_preview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(seed_complaint_sequence, migrations.RunPython.noop),
+    ]
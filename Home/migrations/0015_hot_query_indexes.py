@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0014_idsequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['user', '-complaint_date', '-id'], name='complaint_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['status', '-complaint_date', '-id'], name='complaint_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['-complaint_date', '-id'], name='complaint_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaintupdate',
+            index=models.Index(fields=['complaint', '-updated_at'], name='complaintupdate_history_idx'),
+        ),
+    ]
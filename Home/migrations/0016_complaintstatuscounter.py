@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+def count_existing_complaints(apps, schema_editor):
+    Complaint = apps.get_model('Home', 'Complaint')
+    ComplaintStatusCounter = apps.get_model('Home', 'ComplaintStatusCounter')
+    rows = Complaint.objects.order_by().values('status', 'division', 'category').annotate(total=models.Count('id'))
+    ComplaintStatusCounter.objects.bulk_create([
+        ComplaintStatusCounter(
+            status=row['status'], division=row['division'] or '',
+            category_key=row['category'] or 0, count=row['total'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0015_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintStatusCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20)),
+                ('division', models.CharField(max_length=100)),
+                ('category_key', models.IntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('status', 'division', 'category_key'), name='complaint_counter_bucket')],
+            },
+        ),
+        migrations.RunPython(count_existing_complaints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0021_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='action_thumb',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='action_images/'),
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='complaint_thumb',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='complaints/'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:58
+
+import Home.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Home', '0022_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='complaint',
+            name='action_image',
+            field=models.FileField(blank=True, help_text='Image proof of action taken', null=True, storage=Home.storage.ContentAddressedStorage(), upload_to='action_images/'),
+        ),
+        migrations.AlterField(
+            model_name='complaint',
+            name='action_thumb',
+            field=models.FileField(blank=True, editable=False, null=True, storage=Home.storage.ContentAddressedStorage(), upload_to='action_images/'),
+        ),
+        migrations.AlterField(
+            model_name='complaint',
+            name='complaint_img',
+            field=models.FileField(blank=True, null=True, storage=Home.storage.ContentAddressedStorage(), upload_to='complaints/'),
+        ),
+        migrations.AlterField(
+            model_name='complaint',
+            name='complaint_thumb',
+            field=models.FileField(blank=True, editable=False, null=True, storage=Home.storage.ContentAddressedStorage(), upload_to='complaints/'),
+        ),
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='stored_blob_gc_idx')],
+            },
+        ),
+    ]
@@ -1,7 +1,15 @@
-from django.db import models
+from collections import Counter
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
-from .encryption import EncryptedCharField, EncryptedTextField
+from django.utils.text import Truncator
+from .counters import COUNTER_FIELDS, adjust_counters, bucket, complaint_bucket
+from .encryption import Ciphertext, EncryptedCharField, EncryptedQuerySet, EncryptedTextField, LazyPlaintext, encryption_manager
+from .search import SEARCHABLE_FIELDS, index_complaint
+from .sequences import BlockAllocator
+from .storage import ATTACHMENT_FIELDS, adjust_blob_refs, attachment_names, attachment_storage
+from .student_lists import invalidate_student_complaints
+from .versioning import bump_version
 
 # Create your models here.
 
@@ -16,6 +24,60 @@ class ComplaintCategory(models.Model):
     class Meta:
         verbose_name_plural = "Complaint Categories"
 
+class ComplaintQuerySet(EncryptedQuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create() bypasses save(), so assign ids from the allocator here
+        objs = list(objs)
+        new_objs = [obj for obj in objs if obj.pk is None]
+        for obj, pk in zip(new_objs, complaint_ids.allocate(len(new_objs))):
+            obj.pk = pk
+        with transaction.atomic():
+            created = super().bulk_create(objs, *args, **kwargs)
+            adjust_counters(Counter(complaint_bucket(obj) for obj in objs))
+            adjust_blob_refs(Counter(name for obj in objs for name in attachment_names(obj)))
+            bump_version()
+            invalidate_student_complaints(obj.user_id for obj in objs)
+        return created
+
+    def set_status(self, status, updated_by, admin_response='', action_taken=''):
+        """
+        Move every complaint in the queryset to status with a single UPDATE and
+        log a ComplaintUpdate for each. Returns the affected rows as dicts
+        with id, user_id and the previous status.
+        """
+        with transaction.atomic():
+            # Lock the rows so the counters and audit trail see their final previous state
+            rows = list(self.order_by('id').select_for_update().values('id', 'user_id', *COUNTER_FIELDS))
+            if not rows:
+                return rows
+
+            changes = {'status': status, 'admin_response': admin_response, 'action_taken': action_taken}
+            if status == 'resolved':
+                changes['resolved_date'] = timezone.now()
+            Complaint.objects.filter(pk__in=[row['id'] for row in rows]).update(**changes)
+
+            # update() bypasses save() and the signals, so do their bookkeeping here
+            deltas = Counter()
+            for row in rows:
+                deltas[bucket(*(row[f] for f in COUNTER_FIELDS))] -= 1
+                deltas[bucket(status, row['division'], row['category_id'])] += 1
+            adjust_counters(deltas)
+
+            ComplaintUpdate.objects.bulk_create([
+                ComplaintUpdate(
+                    complaint_id=row['id'],
+                    updated_by=updated_by,
+                    old_status=row['status'],
+                    new_status=status,
+                    update_message=f"Response: {admin_response} | Action: {action_taken}",
+                )
+                for row in rows
+            ])
+            bump_version()
+            invalidate_student_complaints(row['user_id'] for row in rows)
+        return rows
+
+
 class Complaint(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -34,10 +96,20 @@ class Complaint(models.Model):
     # Custom ID field starting from 100
     id = models.AutoField(primary_key=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='complaints')
-    name = EncryptedCharField(max_length=500)  # Encrypted name field (larger for encrypted data)
+    # Encrypted name field (stored as binary)
+    name = EncryptedCharField(max_length=500, compact=True, db_column='name_compact', legacy_column='name', null=True)
     division = models.CharField(max_length=100)  # Division can remain unencrypted
-    complaint = EncryptedTextField()  # Encrypted complaint field
-    complaint_img = models.FileField(upload_to='complaints/', blank=True, null=True)
+    complaint = EncryptedTextField(compact=True, db_column='complaint_compact', legacy_column='complaint', null=True)  # Encrypted complaint field
+    # The text columns of the legacy base64 format, read where the binary columns
+    # are still NULL; compact_encrypted_fields moves their values over and empties them
+    name_legacy = models.CharField(max_length=500, db_column='name', default='', blank=True, editable=False)
+    complaint_legacy = models.TextField(db_column='complaint', default='', blank=True, editable=False)
+    # Separately encrypted start of the complaint, so lists don't load the full text
+    preview = EncryptedCharField(max_length=500, blank=True, editable=False, compact=True)
+    # Attachments are stored once per distinct content (see storage.py)
+    complaint_img = models.FileField(upload_to='complaints/', storage=attachment_storage, blank=True, null=True)
+    # Small versions of the images for pages; the originals are only fetched on demand (see uploads.py)
+    complaint_thumb = models.FileField(upload_to='complaints/', storage=attachment_storage, blank=True, null=True, editable=False)
     category = models.ForeignKey(ComplaintCategory, on_delete=models.SET_NULL, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium')
@@ -45,23 +117,105 @@ class Complaint(models.Model):
     resolved_date = models.DateTimeField(null=True, blank=True)
     admin_response = models.TextField(blank=True)
     action_taken = models.TextField(blank=True, help_text="Actions taken by admin to resolve the complaint")
-    action_image = models.FileField(upload_to='action_images/', blank=True, null=True, help_text="Image proof of action taken")
+    action_image = models.FileField(upload_to='action_images/', storage=attachment_storage, blank=True, null=True, help_text="Image proof of action taken")
+    action_thumb = models.FileField(upload_to='action_images/', storage=attachment_storage, blank=True, null=True, editable=False)
+
+    objects = ComplaintQuerySet.as_manager()
+
+    PREVIEW_LENGTH = 100
+
+    @classmethod
+    def build_preview(cls, text):
+        """Whitespace-normalised start of the complaint text, at most PREVIEW_LENGTH characters"""
+        return Truncator(' '.join(str(text or '').split())).chars(cls.PREVIEW_LENGTH)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The searchable values as loaded, so save() can tell whether they changed
+        instance._loaded_search = {f: instance.__dict__[f] for f in SEARCHABLE_FIELDS if f in instance.__dict__}
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # Unknown again: the next save reindexes
+        self._loaded_search = {}
+
+    def _changed_search_fields(self, searchable, adding):
+        """The fields of searchable whose value differs from the one loaded"""
+        loaded = getattr(self, '_loaded_search', {})
+        changed = set()
+        for field in searchable:
+            value = self.__dict__[field]
+            if isinstance(value, LazyPlaintext):
+                # Never replaced since it was loaded
+                continue
+            if adding or field not in loaded or value != _plaintext(loaded[field]):
+                changed.add(field)
+        return changed
+
     def save(self, *args, **kwargs):
-        if not self.pk:  # Only for new objects
-            # Get the highest existing ID
-            last_complaint = Complaint.objects.order_by('-id').first()
-            if last_complaint:
-                # If there are existing complaints, use the next ID
-                next_id = max(last_complaint.id + 1, 100)
-            else:
-                # If no complaints exist, start from 100
-                next_id = 100
-            
-            # Set the ID manually
-            self.id = next_id
+        adding = not self.pk
+        if adding:  # Only for new objects
+            # Ids come from a per-process block reserved in IdSequence (starting at 100)
+            self.id = complaint_ids.allocate()[0]
+
+        # Searchable fields being saved, and those of them that actually changed
+        update_fields = kwargs.get('update_fields')
+        searchable = set(SEARCHABLE_FIELDS) - self.get_deferred_fields()
+        if update_fields is not None:
+            searchable &= set(update_fields)
+        changed = self._changed_search_fields(searchable, adding)
+
+        # Refresh the preview when the complaint text changed
+        if 'complaint' in changed:
+            self.preview = self.build_preview(self.complaint)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'preview'}
         
-        super().save(*args, **kwargs)
+        # Fields that decide which status counter the complaint is counted in
+        counted = set(COUNTER_FIELDS) - self.get_deferred_fields()
+        if update_fields is not None:
+            counted &= {self._meta.get_field(f).attname for f in update_fields}
+        # Attachment fields being saved, whose blob references move with them
+        attached = set(ATTACHMENT_FIELDS) - self.get_deferred_fields()
+        if update_fields is not None:
+            attached &= set(update_fields)
+
+        with transaction.atomic():
+            previous = None
+            if (counted or attached) and not adding:
+                # Lock the row so a concurrent save can't move it out of the same bucket
+                previous = (
+                    Complaint.objects.filter(pk=self.pk).select_for_update()
+                    .values(*COUNTER_FIELDS, *attached).first()
+                )
+
+            super().save(*args, **kwargs)
+
+            if counted:
+                deltas = Counter()
+                if previous is not None:
+                    deltas[bucket(*(previous[f] for f in COUNTER_FIELDS))] -= 1
+                    # Fields that weren't saved keep their stored value
+                    current = [getattr(self, f) if f in counted else previous[f] for f in COUNTER_FIELDS]
+                else:
+                    current = [getattr(self, f) for f in COUNTER_FIELDS]
+                deltas[bucket(*current)] += 1
+                adjust_counters(deltas)
+
+            if attached:
+                refs = Counter(attachment_names(self, attached))
+                if previous is not None:
+                    refs.subtract(previous[f] for f in attached if previous[f])
+                adjust_blob_refs(refs)
+
+            # Keep the blind search index in sync with the encrypted fields
+            if changed:
+                index_complaint(self, created=adding)
+
+        # What is stored now is what the next save compares against
+        self._loaded_search = {**getattr(self, '_loaded_search', {}), **{f: self.__dict__[f] for f in searchable}}
     
     def __str__(self):
         return f"Complaint #{self.id} by {self.name}"
@@ -70,6 +224,41 @@ class Complaint(models.Model):
         ordering = ['-complaint_date']
         verbose_name = "Complaint"
         verbose_name_plural = "Complaints"
+        # Match the hot access paths: a student's list, the admin list (all or
+        # by status, newest first, paged on complaint_date then id) and the
+        # per-status counts
+        indexes = [
+            models.Index(fields=['user', '-complaint_date', '-id'], name='complaint_user_date_idx'),
+            models.Index(fields=['status', '-complaint_date', '-id'], name='complaint_status_date_idx'),
+            models.Index(fields=['-complaint_date', '-id'], name='complaint_date_idx'),
+        ]
+
+# Complaint ids start at 100
+complaint_ids = BlockAllocator('complaint', Complaint, start=100)
+
+
+def _plaintext(value):
+    # A loaded value as text; batch_decrypt() replaces its Ciphertext after loading
+    if isinstance(value, Ciphertext):
+        return encryption_manager.decrypt(value.value)
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+class ComplaintStatusCounter(models.Model):
+    """Number of complaints per status, division and category (see counters.py)"""
+    status = models.CharField(max_length=20)
+    division = models.CharField(max_length=100)
+    category_key = models.IntegerField(default=0)  # ComplaintCategory id, 0 for none
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.status} / {self.division} / {self.category_key}: {self.count}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'division', 'category_key'], name='complaint_counter_bucket'),
+        ]
+
 
 class ComplaintUpdate(models.Model):
     complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE, related_name='updates')
@@ -84,3 +273,168 @@ class ComplaintUpdate(models.Model):
     
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['complaint', '-updated_at'], name='complaintupdate_history_idx'),
+        ]
+
+
+class ComplaintSearchToken(models.Model):
+    """Keyed-HMAC blind index entry for an encrypted Complaint field"""
+    complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE, related_name='search_tokens')
+    field = models.CharField(max_length=20)
+    token = models.BigIntegerField()
+
+    def __str__(self):
+        return f"Search token for Complaint #{self.complaint_id} ({self.field})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['field', 'token', 'complaint'], name='complaint_search_token_idx'),
+        ]
+
+
+class BackfillCheckpoint(models.Model):
+    """Progress of a resumable maintenance job that walks a table in primary-key order"""
+    name = models.CharField(max_length=100, unique=True)
+    last_pk = models.BigIntegerField(default=0)
+    rows_done = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} (up to #{self.last_pk})"
+
+
+class IdSequence(models.Model):
+    """Next unreserved value of an application-assigned id sequence"""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name} (next {self.next_value})"
+
+
+class DataVersion(models.Model):
+    """Counter bumped after every committed change to a group of tables (see versioning.py)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class OutboundEmail(models.Model):
+    """An email queued by a request and delivered by the send_outbox worker (see outbox.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+
+class Notification(models.Model):
+    """A change a student should hear about; pending ones are merged into one email (see notifications.py)"""
+    EVENT_CHOICES = [
+        ('submitted', 'Submitted'),
+        ('status', 'Status changed'),
+        ('resolved', 'Resolved'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE, related_name='notifications')
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    status = models.CharField(max_length=20, choices=Complaint.STATUS_CHOICES, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    # Set when the notification has been merged into an outbound email
+    flushed_at = models.DateTimeField(null=True, blank=True)
+    email = models.ForeignKey(OutboundEmail, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='notifications')
+
+    def __str__(self):
+        return f"{self.get_event_display()} #{self.complaint_id} for {self.user_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['flushed_at', 'user', 'created_at'], name='notification_pending_idx'),
+        ]
+
+
+class StoredBlob(models.Model):
+    """An attachment file in ContentAddressedStorage and the number of complaint fields referring to it"""
+    # Storage name, blobs/<aa>/<sha256><extension>
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last upload of the content or change of refcount; unreferenced blobs are kept for a while after it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='stored_blob_gc_idx'),
+        ]
+
+
+class ReportJob(models.Model):
+    """A PDF report for one set of filters and one data version, built by run_report_jobs (see reports.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    # sha256 of the filters and the complaint data version; also names the stored file
+    key = models.CharField(max_length=64, unique=True)
+    params = models.JSONField(default=dict)
+    data_version = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def progress(self):
+        """Percentage of rows written so far"""
+        if self.status == 'done':
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(99, self.rows_done * 100 // self.rows_total)
+
+    def __str__(self):
+        return f"Report {self.key[:12]} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='report_job_queue_idx'),
+        ]
@@ -0,0 +1,150 @@
+"""
+Coalesced complaint notifications
+
+Views record a Notification row per change instead of emailing straight
+away. flush_notifications() (run by the send_outbox worker) merges all of a
+recipient's pending notifications into a single outbound email once the
+oldest of them is NOTIFICATION_COALESCE_SECONDS old, so walking a complaint
+through pending -> in progress -> resolved produces one message.
+
+Students who opted into the daily digest (StudentProfile.email_digest), or
+who received more than NOTIFICATION_DIGEST_THRESHOLD notifications in the
+last digest period, get one email per NOTIFICATION_DIGEST_SECONDS instead.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, models, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .outbox import enqueue_email
+
+
+def coalesce_window():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_COALESCE_SECONDS', 300))
+
+
+def digest_period():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_DIGEST_SECONDS', 86400))
+
+
+def notify(user_id, complaint_id, event, status=''):
+    """Record a change for the complaint's owner; it is emailed with the next flush"""
+    notify_many([(user_id, complaint_id, event, status)])
+
+
+def notify_many(changes):
+    """notify() for many (user_id, complaint_id, event, status) tuples in one INSERT"""
+    from .models import Notification
+
+    created = Notification.objects.bulk_create([
+        Notification(user_id=user_id, complaint_id=complaint_id, event=event, status=status)
+        for user_id, complaint_id, event, status in changes
+    ])
+    if created and getattr(settings, 'EMAIL_OUTBOX_EAGER', False):
+        transaction.on_commit(flush_notifications)
+
+
+def _digest_users(user_ids, now):
+    """The subset of user_ids whose notifications are sent as a daily digest"""
+    from Accounts.models import StudentProfile
+    from .models import Notification
+
+    digest = set(StudentProfile.objects.filter(user_id__in=user_ids, email_digest=True).values_list('user_id', flat=True))
+    threshold = getattr(settings, 'NOTIFICATION_DIGEST_THRESHOLD', 0)
+    if threshold:
+        # Busy recipients are switched to the digest automatically
+        digest.update(
+            Notification.objects.filter(user_id__in=user_ids, created_at__gte=now - digest_period())
+            .values('user_id').annotate(n=models.Count('id')).filter(n__gt=threshold)
+            .values_list('user_id', flat=True)
+        )
+    return digest
+
+
+def _compose(user, notifications, digest):
+    """Subject and body of one email covering all of the user's pending notifications"""
+    from .models import Complaint
+
+    status_names = dict(Complaint.STATUS_CHOICES)
+    complaints = {}
+    for notification in notifications:
+        complaints.setdefault(notification.complaint_id, []).append(notification)
+
+    summaries = []
+    for complaint_id, events in complaints.items():
+        lines = []
+        for notification in events:
+            if notification.event == 'submitted':
+                lines.append('We have received your complaint and our team is reviewing the details.')
+            elif notification.event == 'resolved':
+                lines.append('Your complaint has been marked as resolved.')
+            else:
+                lines.append(f'Status updated to {status_names.get(notification.status, notification.status)}.')
+        summaries.append({'id': complaint_id, 'lines': lines, 'last_event': events[-1].event})
+
+    if digest:
+        subject = 'Your Daily Complaint Digest'
+    elif len(summaries) > 1:
+        subject = f'Updates on {len(summaries)} of Your Complaints'
+    elif summaries[0]['last_event'] == 'resolved':
+        subject = f'Complaint #{summaries[0]["id"]} Resolved'
+    elif all(n.event == 'submitted' for n in notifications):
+        subject = f'Complaint #{summaries[0]["id"]} Submitted Successfully'
+    else:
+        subject = f'Update on Your Complaint #{summaries[0]["id"]}'
+
+    body = render_to_string('emails/complaint_notifications.txt', {
+        'name': user.first_name or user.username,
+        'complaints': summaries,
+        'digest': digest,
+        'any_resolved': any(s['last_event'] == 'resolved' for s in summaries),
+    })
+    return subject, body
+
+
+def _flush_user(user_id, now, digest):
+    """Merge the user's pending notifications into one queued email; False if another worker has them"""
+    from .models import Notification
+
+    with transaction.atomic():
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        notifications = list(
+            Notification.objects.filter(user_id=user_id, flushed_at__isnull=True)
+            .select_for_update(skip_locked=skip_locked).order_by('created_at', 'id')
+        )
+        if not notifications:
+            return False
+        user = User.objects.only('username', 'first_name', 'email').get(pk=user_id)
+        email = None
+        if user.email:
+            subject, body = _compose(user, notifications, digest)
+            email = enqueue_email(subject, body, [user.email])[0]
+        # Students without an address have nothing to receive; their notifications are just closed
+        Notification.objects.filter(pk__in=[n.pk for n in notifications]).update(flushed_at=now, email=email)
+    return email is not None
+
+
+def flush_notifications(now=None):
+    """Queue one email per recipient whose window (or digest period) has passed; returns the count"""
+    from .models import Notification
+
+    now = now or timezone.now()
+    oldest = dict(
+        Notification.objects.filter(flushed_at__isnull=True)
+        .values('user_id').annotate(first=models.Min('created_at')).order_by()
+        .values_list('user_id', 'first')
+    )
+    due = [user_id for user_id, first in oldest.items() if first <= now - coalesce_window()]
+    if not due:
+        return 0
+
+    digest_users = _digest_users(due, now)
+    queued = 0
+    for user_id in due:
+        digest = user_id in digest_users
+        if digest and oldest[user_id] > now - digest_period():
+            continue
+        if _flush_user(user_id, now, digest):
+            queued += 1
+    return queued
@@ -0,0 +1,114 @@
+"""
+Durable outbox for notification emails
+
+Views only insert OutboundEmail rows, so request latency never depends on
+the mail server, and a queued email is rolled back with a transaction that
+fails. The send_outbox worker claims due rows, delivers them over a single
+SMTP connection per batch and records the outcome; failures are retried
+with exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS is reached.
+
+With EMAIL_OUTBOX_EAGER the queue is drained right after each commit in the
+request process instead, which is meant for development and tests together
+with the console or locmem email backend.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, models, transaction
+from django.utils import timezone
+
+# Rows left in 'sending' longer than this belong to a worker that died
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def default_from_email():
+    return getattr(settings, 'DEFAULT_FROM_EMAIL', '') or getattr(settings, 'EMAIL_HOST_USER', '') or ''
+
+
+def enqueue_email(subject, body, recipients, from_email=None):
+    """Queue one email per recipient; delivery happens after the transaction commits"""
+    from .models import OutboundEmail
+
+    emails = OutboundEmail.objects.bulk_create([
+        OutboundEmail(subject=subject, body=body, from_email=from_email or default_from_email(), to=recipient)
+        for recipient in recipients if recipient
+    ])
+    if emails and getattr(settings, 'EMAIL_OUTBOX_EAGER', False):
+        transaction.on_commit(deliver_pending)
+    return emails
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt after attempts failures"""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_SECONDS', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 6 * 3600))
+
+
+def claim_batch(limit=100):
+    """Mark up to limit due emails as 'sending' and return them"""
+    from .models import OutboundEmail
+
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(
+        models.Q(status='queued', next_attempt_at__lte=now)
+        | models.Q(status='sending', claimed_at__lt=now - CLAIM_TIMEOUT)
+    ).order_by('next_attempt_at')
+    with transaction.atomic():
+        # Concurrent workers skip each other's rows where the database allows it
+        skip_locked = db_connection.features.has_select_for_update_skip_locked
+        batch = list(due.select_for_update(skip_locked=skip_locked)[:limit])
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in batch]).update(status='sending', claimed_at=now)
+    return batch
+
+
+def _record_failure(email, error):
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5):
+        email.status = 'failed'
+    else:
+        email.status = 'queued'
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def deliver_pending(limit=100):
+    """
+    Deliver one batch of due emails over a single connection. Returns a
+    dict with the number of emails sent, rescheduled and given up on.
+    """
+    result = {'sent': 0, 'retried': 0, 'failed': 0}
+    batch = claim_batch(limit)
+    if not batch:
+        return result
+
+    mail_connection = get_connection(fail_silently=False)
+    try:
+        mail_connection.open()
+    except Exception as e:
+        # No connection at all: every message in the batch is retried later
+        for email in batch:
+            _record_failure(email, e)
+            result['failed' if email.status == 'failed' else 'retried'] += 1
+        return result
+
+    try:
+        for email in batch:
+            message = EmailMessage(email.subject, email.body, email.from_email or None, [email.to],
+                                   connection=mail_connection)
+            try:
+                message.send()
+            except Exception as e:
+                _record_failure(email, e)
+                result['failed' if email.status == 'failed' else 'retried'] += 1
+                continue
+            # Recorded per message so a crash mid-batch doesn't resend what already went out
+            email.status = 'sent'
+            email.attempts += 1
+            email.sent_at = timezone.now()
+            email.last_error = ''
+            email.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+            result['sent'] += 1
+    finally:
+        mail_connection.close()
+    return result
@@ -0,0 +1,103 @@
+"""
+Keyset (cursor) pagination for complaint lists
+
+Pages are ordered newest first on a (timestamp, id) key, (complaint_date,
+id) for complaints, and a cursor holds the key of the row at the edge of a
+page. The next page is "rows before this key" rather than an OFFSET, so the
+database seeks straight to it through the (…, complaint_date, id) indexes
+and page 500 costs the same as page 1.
+
+iter_keyset() walks a whole queryset the same way for exports. Unlike
+.iterator(), whose result set the MySQL driver buffers completely before
+returning the first row, every query returns at most one chunk.
+"""
+import base64
+import binascii
+from datetime import datetime
+from django.db import models
+
+PAGE_SIZE = 25
+
+KEY = ('complaint_date', 'id')
+ORDERING = ('-complaint_date', '-id')
+
+
+def encode_cursor(obj, key=KEY):
+    date_field, id_field = key
+    key = f'{getattr(obj, date_field).isoformat()}|{getattr(obj, id_field)}'
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (timestamp, id) key of a cursor, or None if it isn't valid"""
+    try:
+        key = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date, pk = key.rsplit('|', 1)
+        return datetime.fromisoformat(date), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """One page of rows with the cursors of its neighbours"""
+
+    def __init__(self, items, has_newer, has_older, key=KEY):
+        self.items = items
+        self.newer_cursor = encode_cursor(items[0], key) if items and has_newer else None
+        self.older_cursor = encode_cursor(items[-1], key) if items and has_older else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_other_pages(self):
+        return bool(self.newer_cursor or self.older_cursor)
+
+
+def _beyond(key, value, direction):
+    # (date, id) past value in direction 'lt' or 'gt'; the redundant bound on
+    # date alone lets an index range scan start right at the key
+    (date_field, id_field), (date, pk) = key, value
+    return models.Q(**{f'{date_field}__{direction}e': date}) & (
+        models.Q(**{f'{date_field}__{direction}': date})
+        | models.Q(**{date_field: date, f'{id_field}__{direction}': pk})
+    )
+
+
+def paginate(queryset, after=None, before=None, per_page=PAGE_SIZE, key=KEY):
+    """
+    Return the KeysetPage of queryset that follows the after cursor (older
+    rows) or precedes the before cursor (newer rows). Without a valid
+    cursor the newest page is returned.
+    """
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+
+    if before:
+        # Walk towards newer rows in ascending order, then flip the page back
+        rows = list(queryset.filter(_beyond(key, before, 'gt')).order_by(*key)[:per_page + 1])
+        has_newer = len(rows) > per_page
+        return KeysetPage(rows[:per_page][::-1], has_newer=has_newer, has_older=True, key=key)
+
+    queryset = queryset.order_by(*(f'-{field}' for field in key))
+    if after:
+        queryset = queryset.filter(_beyond(key, after, 'lt'))
+    rows = list(queryset[:per_page + 1])
+    return KeysetPage(rows[:per_page], has_newer=after is not None, has_older=len(rows) > per_page, key=key)
+
+
+def iter_keyset(queryset, chunk_size, key=KEY):
+    """Yield every row of queryset newest first, reading chunk_size rows per query"""
+    date_field, id_field = key
+    queryset = queryset.order_by(*(f'-{field}' for field in key))
+    last = None
+    while True:
+        chunk = queryset.filter(_beyond(key, last, 'lt')) if last else queryset
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = (getattr(rows[-1], date_field), getattr(rows[-1], id_field))
@@ -0,0 +1,105 @@
+"""
+EXPLAIN checks for the hot complaint queries
+
+Each hot query is run through the database's EXPLAIN and the plan is
+inspected for a full table scan or an explicit sort of the result. Used by
+the test suite to catch a query that silently stops using its index.
+"""
+import json
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+
+def hot_queries(user, complaint, status='pending'):
+    """Return (name, queryset) pairs for the queries the views rely on"""
+    from .models import Complaint, ComplaintUpdate
+    from .pagination import ORDERING
+
+    # A later page adds the keyset condition below the cursor row
+    after = (
+        Q(complaint_date__lte=complaint.complaint_date)
+        & (Q(complaint_date__lt=complaint.complaint_date) | Q(complaint_date=complaint.complaint_date, id__lt=complaint.pk))
+    )
+    return [
+        ('student home', Complaint.objects.filter(user=user).order_by(*ORDERING)),
+        ('student home, later page', Complaint.objects.filter(after, user=user).order_by(*ORDERING)),
+        ('admin list', Complaint.objects.order_by(*ORDERING)),
+        ('admin list, later page', Complaint.objects.filter(after).order_by(*ORDERING)),
+        ('admin list by status', Complaint.objects.filter(status=status).order_by(*ORDERING)),
+        ('status count', Complaint.objects.filter(status=status).values('status').annotate(n=Count('pk'))),
+        ('complaint history', ComplaintUpdate.objects.filter(complaint=complaint).order_by('-updated_at')),
+    ]
+
+
+def _sqlite_problems(plan):
+    problems = []
+    for line in plan.splitlines():
+        if 'SCAN' in line and 'INDEX' not in line:
+            problems.append(line.strip())
+        elif 'TEMP B-TREE FOR ORDER BY' in line:
+            problems.append(line.strip())
+    return problems
+
+
+def _postgresql_problems(plan):
+    return [line.strip() for line in plan.splitlines() if 'Seq Scan' in line or line.strip().startswith('Sort')]
+
+
+def _mysql_problems(plan):
+    problems = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            table = node.get('table')
+            if isinstance(table, dict) and table.get('access_type') == 'ALL':
+                problems.append(f'full scan of {table.get("table_name")}')
+            if node.get('using_filesort'):
+                problems.append('filesort')
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(json.loads(plan))
+    return problems
+
+
+def analyze(*models):
+    """Refresh planner statistics for the given models' tables"""
+    tables = [connection.ops.quote_name(model._meta.db_table) for model in models]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(f'ANALYZE TABLE {", ".join(tables)}')
+        else:
+            for table in tables:
+                cursor.execute(f'ANALYZE {table}')
+
+
+def explain(queryset):
+    """Return (plan, problems) for a queryset on the current database"""
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        # Small test tables are cheaper to scan; only ask whether an index is usable
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        return plan, _postgresql_problems(plan)
+    if vendor == 'mysql':
+        plan = queryset.explain(format='json')
+        return plan, _mysql_problems(plan)
+    if vendor == 'sqlite':
+        plan = queryset.explain()
+        return plan, _sqlite_problems(plan)
+    raise NotImplementedError(f'No plan check for {vendor}')
+
+
+def check_hot_queries(user, complaint, status='pending'):
+    """Return {name: (plan, problems)} for every hot query that isn't index-only"""
+    failures = {}
+    for name, queryset in hot_queries(user, complaint, status):
+        plan, problems = explain(queryset)
+        if problems:
+            failures[name] = (plan, problems)
+    return failures
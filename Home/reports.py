@@ -0,0 +1,148 @@
+"""
+Background PDF report jobs
+
+"Download as PDF" no longer builds the report in the web worker. The
+filters are turned into a ReportJob keyed by a hash of the filters and the
+complaint DataVersion (versioning.py). If a finished job with that key
+exists, its stored file is served straight away. Otherwise the job is
+queued, and requests for the same report made while it is being built
+share it. The run_report_jobs worker builds queued jobs and records
+progress as it goes. Because the key changes with the data, a stored
+report is never stale; old artifacts are pruned after
+REPORT_RETENTION_HOURS.
+
+With REPORT_JOBS_EAGER (development, and serverless deployments that have
+no worker and a read-only filesystem) no job is queued: the report is
+built inside the request into a temporary file and sent from there, and
+nothing is stored.
+"""
+import hashlib
+import json
+import tempfile
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, models, transaction
+from django.utils import timezone
+from .exports import write_complaints_pdf
+from .search import filter_complaints
+from .versioning import current_version
+
+# Running jobs whose worker hasn't reported progress for this long are picked up again
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+REPORT_PARAMS = ('status', 'search')
+
+
+def report_params(query):
+    """The filters of a report from request.GET; everything else is ignored"""
+    return {name: query.get(name) or '' for name in REPORT_PARAMS}
+
+
+def report_key(params, version):
+    payload = json.dumps({'report': 'complaints.pdf', 'params': params, 'version': version}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def report_queryset(params):
+    from .models import Complaint
+
+    complaints = Complaint.objects.select_related('user').order_by('-complaint_date', '-id').batch_decrypt()
+    return filter_complaints(complaints, params['status'], params['search'])
+
+
+def request_report(params, user):
+    """The ReportJob for these filters and the current data, queued if there is none yet"""
+    from .models import ReportJob
+
+    version = current_version()
+    job, _ = ReportJob.objects.get_or_create(
+        key=report_key(params, version),
+        defaults={'params': params, 'data_version': version, 'requested_by': user},
+    )
+    if job.status == 'failed':
+        # A failed build is retried by the next request for it
+        ReportJob.objects.filter(pk=job.pk, status='failed').update(status='queued', rows_done=0, error='')
+        job.refresh_from_db()
+    return job
+
+
+def claim_job():
+    """Mark the oldest queued (or abandoned) job as running and return it, or None"""
+    from .models import ReportJob
+
+    now = timezone.now()
+    due = ReportJob.objects.filter(
+        models.Q(status='queued')
+        | models.Q(status='running', claimed_at__lt=now - CLAIM_TIMEOUT)
+    ).order_by('created_at')
+    with transaction.atomic():
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        job = due.select_for_update(skip_locked=skip_locked).first()
+        if job is not None:
+            job.status = 'running'
+            job.claimed_at = now
+            job.rows_done = 0
+            job.save(update_fields=['status', 'claimed_at', 'rows_done'])
+    return job
+
+
+def build_report(job):
+    """Write the PDF of a claimed job to storage and mark it done (or failed)"""
+    from .models import ReportJob
+
+    jobs = ReportJob.objects.filter(pk=job.pk)
+    complaints = report_queryset(job.params)
+    job.rows_total = complaints.count()
+    jobs.update(rows_total=job.rows_total)
+
+    def progress(rows_done):
+        # Doubles as the heartbeat that keeps other workers from taking the job over
+        jobs.update(rows_done=rows_done, claimed_at=timezone.now())
+
+    try:
+        with tempfile.TemporaryFile() as out:
+            write_complaints_pdf(complaints, out, progress=progress)
+            out.seek(0)
+            if job.file:
+                job.file.delete(save=False)
+            # Content-addressed: the name is the key, so an identical report is never stored twice
+            job.file.save(f'{job.key}.pdf', File(out), save=False)
+    except Exception as e:
+        job.status = 'failed'
+        job.error = f'{type(e).__name__}: {e}'
+    else:
+        job.status = 'done'
+        job.rows_done = job.rows_total
+        job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'rows_done', 'file', 'error', 'finished_at'])
+    return job
+
+
+def render_report(params):
+    """The PDF for these filters in a temporary file, read from the start; closing it deletes it"""
+    out = tempfile.TemporaryFile()
+    try:
+        write_complaints_pdf(report_queryset(params), out)
+        out.seek(0)
+    except BaseException:
+        out.close()
+        raise
+    return out
+
+
+def prune_reports(max_age=None):
+    """Delete finished jobs and their files older than max_age; returns the number deleted"""
+    from .models import ReportJob
+
+    if max_age is None:
+        max_age = timedelta(hours=getattr(settings, 'REPORT_RETENTION_HOURS', 24))
+    expired = list(ReportJob.objects.filter(
+        status__in=['done', 'failed'], finished_at__lt=timezone.now() - max_age,
+    ))
+    for job in expired:
+        if job.file:
+            job.file.delete(save=False)
+    ReportJob.objects.filter(pk__in=[job.pk for job in expired]).delete()
+    return len(expired)
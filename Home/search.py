@@ -0,0 +1,140 @@
+"""
+Blind index for searching encrypted complaint fields
+
+Encrypted columns can't be searched with ``icontains``: the database only sees
+ciphertext. Instead every searchable value is split into tokens that are run
+through a keyed HMAC and stored in ``ComplaintSearchToken``. A search hashes
+the query the same way and becomes an indexed lookup on the token table.
+"""
+import hashlib
+import hmac
+import re
+from functools import lru_cache
+from django.conf import settings
+from django.db import models
+
+# Names are matched on 3-character n-grams so partial names still match,
+# complaint bodies on whole words to keep the token table small.
+NGRAM_SIZE = 3
+NGRAM_FIELDS = ('name',)
+WORD_FIELDS = ('complaint',)
+SEARCHABLE_FIELDS = NGRAM_FIELDS + WORD_FIELDS
+
+WORD_RE = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=None)
+def _index_key(secret):
+    # Separate key from the one used for encryption, derived from the same secret
+    return hmac.new(secret.encode(), b'complaint-blind-index', hashlib.sha256).digest()
+
+
+def _token(field, gram):
+    """Hash a single search term into a signed 64-bit token"""
+    secret = getattr(settings, 'SEARCH_INDEX_KEY', None) or getattr(settings, 'ENCRYPTION_KEY')
+    digest = hmac.new(_index_key(secret), f'{field}\x00{gram}'.encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+def _words(text):
+    return WORD_RE.findall(str(text).casefold()) if text else []
+
+
+def _ngrams(word):
+    if len(word) < NGRAM_SIZE:
+        # Short words are indexed whole, together with their prefixes
+        return {word[:i] for i in range(1, len(word) + 1)}
+    grams = {word[i:i + NGRAM_SIZE] for i in range(len(word) - NGRAM_SIZE + 1)}
+    grams.update(word[:i] for i in range(1, NGRAM_SIZE))
+    return grams
+
+
+def _query_grams(word):
+    if len(word) < NGRAM_SIZE:
+        return {word}
+    return {word[i:i + NGRAM_SIZE] for i in range(len(word) - NGRAM_SIZE + 1)}
+
+
+def field_tokens(field, text):
+    """Return the set of blind-index tokens stored for a field value"""
+    grams = set()
+    for word in _words(text):
+        grams.update(_ngrams(word) if field in NGRAM_FIELDS else {word})
+    return {_token(field, gram) for gram in grams}
+
+
+def query_tokens(field, query):
+    """Return the tokens that must all be present for a field to match query"""
+    grams = set()
+    for word in _words(query):
+        grams.update(_query_grams(word) if field in NGRAM_FIELDS else {word})
+    return {_token(field, gram) for gram in grams}
+
+
+def build_search_tokens(complaint, values=None):
+    """
+    Build (unsaved) ComplaintSearchToken rows for a complaint. values maps
+    field names to plaintext when the instance only holds ciphertext.
+    """
+    from .models import ComplaintSearchToken
+
+    if values is None:
+        values = {field: getattr(complaint, field) for field in SEARCHABLE_FIELDS}
+    return [
+        ComplaintSearchToken(complaint_id=complaint.pk, field=field, token=token)
+        for field in SEARCHABLE_FIELDS
+        for token in field_tokens(field, values[field])
+    ]
+
+
+def index_complaint(complaint, created=False):
+    """Replace the blind-index tokens of a saved complaint (a just created one has none yet)"""
+    from .models import ComplaintSearchToken
+
+    if not created:
+        ComplaintSearchToken.objects.filter(complaint_id=complaint.pk).delete()
+    ComplaintSearchToken.objects.bulk_create(build_search_tokens(complaint))
+
+
+def blind_index_q(query):
+    """
+    Q object matching complaints whose name or complaint text contains every
+    word of query. Names match on substrings of 3+ characters (or prefixes for
+    shorter words), complaint text on whole words.
+    """
+    from .models import ComplaintSearchToken
+
+    condition = models.Q(pk__in=[])
+    for field in SEARCHABLE_FIELDS:
+        tokens = query_tokens(field, query)
+        if not tokens:
+            continue
+        matching = (
+            ComplaintSearchToken.objects
+            .filter(field=field, token__in=tokens)
+            .values('complaint')
+            .annotate(matched=models.Count('token', distinct=True))
+            .filter(matched=len(tokens))
+            .values('complaint')
+        )
+        condition |= models.Q(pk__in=matching)
+    return condition
+
+
+def admin_search_q(query):
+    """The Admin_Panel search: the blind index, plus division and username substrings"""
+    return (
+        blind_index_q(query) |
+        models.Q(division__icontains=query) |
+        models.Q(user__username__icontains=query)
+    )
+
+
+def filter_complaints(complaints, status=None, search=None):
+    """Apply the Admin_Panel status and search filters, shared by the listing and the exports"""
+    if status:
+        complaints = complaints.filter(status=status)
+    if search:
+        # name/complaint are encrypted, so they are matched through the blind index
+        complaints = complaints.filter(admin_search_q(search))
+    return complaints
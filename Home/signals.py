@@ -0,0 +1,47 @@
+from collections import Counter
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .categories import category_cache
+from .counters import adjust_counters, complaint_bucket, uncategorise
+from .models import Complaint, ComplaintCategory, ComplaintUpdate
+from .storage import adjust_blob_refs, attachment_names
+from .student_lists import invalidate_student_complaints
+from .versioning import bump_version
+
+
+@receiver(pre_delete, sender=Complaint)
+def uncount_complaint(sender, instance, **kwargs):
+    # pre_delete runs inside the deletion's transaction, also for cascades
+    # from User, and the row can still be read if fields were deferred
+    adjust_counters({complaint_bucket(instance): -1})
+
+
+@receiver(pre_delete, sender=Complaint)
+def release_attachments(sender, instance, **kwargs):
+    # The blobs themselves are removed later by reconcile_blobs
+    refs = Counter()
+    refs.subtract(attachment_names(instance))
+    adjust_blob_refs(refs)
+
+
+@receiver(pre_delete, sender=ComplaintCategory)
+def uncategorise_counters(sender, instance, **kwargs):
+    # Complaints of a deleted category are set to NULL without save()
+    uncategorise(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Complaint)
+@receiver([post_save, post_delete], sender=ComplaintUpdate)
+@receiver([post_save, post_delete], sender=ComplaintCategory)
+def complaint_data_changed(sender, **kwargs):
+    bump_version()
+
+
+@receiver([post_save, post_delete], sender=Complaint)
+def student_complaints_changed(sender, instance, **kwargs):
+    invalidate_student_complaints([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=ComplaintCategory)
+def categories_changed(sender, **kwargs):
+    category_cache.invalidate()
@@ -0,0 +1,191 @@
+"""
+Content-addressed storage for complaint attachments
+
+Students resubmit the same screenshot and admins attach the same proof to
+many complaints, so attachments are stored by the sha256 of their bytes:
+the upload is hashed while it is streamed to a temporary file chunk by
+chunk, then moved to blobs/<first two hex digits>/<hash><extension>. A
+blob that is already stored isn't written again, whichever field or
+complaint it was uploaded for.
+
+A StoredBlob row per blob counts the Complaint fields that refer to it.
+Complaint.save(), bulk_create() and the pre_delete signal move the counts
+along with the file fields, in the same transaction. Blobs whose count
+drops to zero aren't deleted straight away, since the same bytes may be
+uploaded again at any moment; `python manage.py reconcile_blobs` recounts
+the references and removes blobs that have been unreferenced for
+BLOB_GRACE_HOURS.
+
+Files stored before this backend existed keep their old names and are
+served as before; they have no StoredBlob row and aren't counted.
+"""
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+# Partially written uploads; they are moved into place once hashed
+TEMP_DIR = f'{BLOB_DIR}/tmp'
+
+# Complaint fields stored in ContentAddressedStorage
+ATTACHMENT_FIELDS = ('complaint_img', 'complaint_thumb', 'action_image', 'action_thumb')
+
+
+def blob_name(digest, original_name):
+    extension = os.path.splitext(original_name)[1].lower()[:10]
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{extension}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_DIR + '/') and not name.startswith(TEMP_DIR + '/')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that stores each distinct file once, named by its sha256"""
+
+    def get_available_name(self, name, max_length=None):
+        # The name is chosen in _save() from the content; equal content shares it
+        return name
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        temp_dir = self.path(TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+
+            name = blob_name(digest.hexdigest(), name)
+            with transaction.atomic():
+                # Locks the row (and refreshes updated_at), so reconcile_blobs
+                # can't remove the blob between the check below and the commit
+                StoredBlob.objects.update_or_create(name=name, defaults={'size': size})
+                path = self.path(name)
+                if os.path.exists(path):
+                    os.remove(temp_path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(temp_path, self.file_permissions_mode)
+                    os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+    def delete(self, name):
+        """Delete a blob unless a complaint still refers to it"""
+        from .models import StoredBlob
+
+        if is_blob(name):
+            with transaction.atomic():
+                blobs = StoredBlob.objects.select_for_update().filter(name=name)
+                if blobs.filter(refcount__gt=0).exists():
+                    return
+                blobs.delete()
+                super().delete(name)
+        else:
+            super().delete(name)
+
+
+attachment_storage = ContentAddressedStorage()
+
+
+def attachment_names(obj, fields=ATTACHMENT_FIELDS):
+    """Blob names an object's attachment fields refer to"""
+    names = []
+    for field in fields:
+        value = getattr(obj, field)
+        if value and is_blob(value.name):
+            names.append(value.name)
+    return names
+
+
+def adjust_blob_refs(deltas):
+    """Apply {blob name: change} to the reference counts"""
+    from .models import StoredBlob
+
+    now = timezone.now()
+    # A fixed order, so concurrent adjustments lock the rows in the same order
+    for name, delta in sorted(deltas.items()):
+        if delta and is_blob(name):
+            StoredBlob.objects.filter(name=name).update(
+                refcount=models.F('refcount') + delta, updated_at=now,
+            )
+
+
+def rebuild_blob_refs():
+    """
+    Recount the references to every blob from the complaint table. Returns
+    {blob name: actual - stored} for the counts that were off.
+    """
+    from .models import Complaint, StoredBlob
+
+    with transaction.atomic():
+        stored = dict(StoredBlob.objects.select_for_update().values_list('name', 'refcount'))
+        actual = Counter()
+        for names in Complaint.objects.order_by().values_list(*ATTACHMENT_FIELDS).iterator():
+            actual.update(name for name in names if is_blob(name))
+
+        drift = {name: actual[name] - stored.get(name, 0)
+                 for name in set(actual) | set(stored) if actual[name] != stored.get(name, 0)}
+        now = timezone.now()
+        for name, delta in sorted(drift.items()):
+            if name in stored:
+                StoredBlob.objects.filter(name=name).update(refcount=actual[name], updated_at=now)
+            elif attachment_storage.exists(name):
+                # Written by a transaction whose row was rolled back, and referenced since
+                StoredBlob.objects.create(name=name, size=attachment_storage.size(name), refcount=actual[name])
+    return drift
+
+
+def collect_blobs(grace=None):
+    """
+    Delete blobs unreferenced for longer than grace, and leftover files with
+    no StoredBlob row. Returns the number of files deleted.
+    """
+    from .models import StoredBlob
+
+    if grace is None:
+        grace = timedelta(hours=getattr(settings, 'BLOB_GRACE_HOURS', 24))
+    cutoff = timezone.now() - grace
+    storage = attachment_storage
+    deleted = 0
+
+    unreferenced = StoredBlob.objects.filter(refcount__lte=0, updated_at__lt=cutoff)
+    for name in list(unreferenced.values_list('name', flat=True)):
+        with transaction.atomic():
+            # Re-checked under the lock: an upload of the same bytes refreshes updated_at
+            if unreferenced.filter(name=name).select_for_update().exists():
+                storage.delete(name)
+                deleted += 1
+
+    # Files without a row: interrupted uploads and rolled back transactions
+    known = set(StoredBlob.objects.values_list('name', flat=True))
+    root = storage.path(BLOB_DIR)
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in known:
+                continue
+            if os.path.getmtime(path) < cutoff.timestamp():
+                os.remove(path)
+                deleted += 1
+    return deleted
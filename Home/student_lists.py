@@ -0,0 +1,91 @@
+"""
+Cached complaint list of the student home page
+
+Each page of a student's list is stored as plain rows with the category
+already joined in. Entries are keyed by a per-student DataVersion that is
+bumped after every committed write to that student's complaints, so a
+student refreshing the page is served from the cache until something of
+theirs actually changes. The version is read from the database, so a write
+handled by one process is seen by all of them even with the per-process
+local memory cache. Previews are cached as ciphertext and only decrypted
+(through the in-process LRU) when rendered.
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from .categories import category_cache
+from .encryption import LazyPlaintext
+from .pagination import decode_cursor, paginate
+from .versioning import bump_versions, current_version
+
+# Columns behind the rows; everything else (name, full text, images) stays unloaded
+LIST_COLUMNS = ('id', 'preview', 'category__name', 'priority', 'status', 'complaint_date', 'action_taken')
+
+
+def _version_name(user_id):
+    return f'student-complaints:{user_id}'
+
+
+def invalidate_student_complaints(user_ids):
+    """Retire the cached lists of these students once the current transaction commits"""
+    bump_versions(_version_name(user_id) for user_id in user_ids)
+
+
+def _row(complaint):
+    return {
+        'id': complaint.id,
+        'preview': getattr(complaint.preview, 'ciphertext', complaint.preview),
+        'category_name': complaint.category.name if complaint.category else None,
+        'priority': complaint.priority,
+        'priority_display': complaint.get_priority_display(),
+        'status': complaint.status,
+        'status_display': complaint.get_status_display(),
+        'complaint_date': complaint.complaint_date,
+        'action_taken': complaint.action_taken,
+    }
+
+
+class StudentPage:
+    """A cached page of rows, shaped like KeysetPage for the templates"""
+
+    def __init__(self, rows, newer_cursor, older_cursor):
+        self.items = rows
+        self.newer_cursor = newer_cursor
+        self.older_cursor = older_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_other_pages(self):
+        return bool(self.newer_cursor or self.older_cursor)
+
+
+def student_complaints_page(user, after=None, before=None):
+    """Return a StudentPage of the user's complaints, newest first"""
+    from .models import Complaint
+
+    # Rows carry category names, so a category change also retires them
+    version = current_version(_version_name(user.pk))
+    # Cursors come from the query string: key on their decoded value (invalid
+    # ones mean the first page), hashed so the key stays short and printable
+    cursors = (decode_cursor(after) if after else None, decode_cursor(before) if before else None)
+    digest = hashlib.sha256(repr(cursors).encode()).hexdigest()[:32]
+    key = f'student-complaints:{user.pk}:{version}:{category_cache.version}:{digest}'
+    cached = cache.get(key)
+    if cached is None:
+        complaints = (
+            Complaint.objects.filter(user=user).select_related('category')
+            .only(*LIST_COLUMNS).lazy_decrypt()
+        )
+        page = paginate(complaints, after, before)
+        cached = ([_row(c) for c in page], page.newer_cursor, page.older_cursor)
+        cache.set(key, cached, getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 300))
+
+    rows, newer_cursor, older_cursor = cached
+    # Previews are decrypted per request, only for the rows actually rendered
+    rows = [{**row, 'preview': LazyPlaintext(row['preview'])} for row in rows]
+    return StudentPage(rows, newer_cursor, older_cursor)
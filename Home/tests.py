@@ -1,3 +1,300 @@
-from django.test import TestCase
+import base64
+import os
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from cryptography.fernet import Fernet
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .counters import rebuild_counters, status_totals
+from .encryption import encryption_manager, is_compact, stored_values
+from .ingest import ingest_complaints
+from .models import Complaint, ComplaintCategory, ComplaintSearchToken, ComplaintUpdate, IdSequence
+from .query_plans import analyze, check_hot_queries
+from .search import blind_index_q
+from .sequences import BlockAllocator
+
+
+class HotQueryPlanTests(TestCase):
+    """The hot complaint queries must keep using their indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f'student{i}') for i in range(20)])
+        statuses = [status for status, _ in Complaint.STATUS_CHOICES]
+        complaints = Complaint.objects.bulk_create([
+            Complaint(
+                user=cls.users[i % len(cls.users)],
+                name=f'Student {i}',
+                division='A',
+                complaint=f'Complaint number {i}',
+                status=statuses[i % len(statuses)],
+            )
+            for i in range(400)
+        ])
+        admin = User.objects.create(username='admin', is_staff=True)
+        ComplaintUpdate.objects.bulk_create([
+            ComplaintUpdate(complaint=complaint, updated_by=admin, old_status='pending',
+                            new_status=complaint.status, update_message='seed')
+            for complaint in complaints
+        ])
+        cls.complaint = complaints[0]
+        # Give the planner real statistics, as production would have
+        analyze(Complaint, ComplaintUpdate)
+
+    def test_hot_queries_use_indexes(self):
+        failures = check_hot_queries(self.users[0], self.complaint)
+        self.assertFalse(failures, '\n\n'.join(
+            f'{name}: {", ".join(problems)}\n{plan}' for name, (plan, problems) in failures.items()
+        ))
+
+
+def legacy_value(text, key):
+    """A value in the legacy format: the base64 encoded Fernet token, as text"""
+    return base64.urlsafe_b64encode(Fernet(key).encrypt(text.encode())).decode()
+
+
+class EncryptedStorageTests(TestCase):
+    """Legacy and compact ciphertexts must read the same and survive key rotation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='student')
+
+    def setUp(self):
+        encryption_manager.reset()
+        self.addCleanup(encryption_manager.reset)
+
+    def make_legacy(self, name, complaint, key):
+        # Written before migration 0012: only the legacy text columns are set
+        obj = Complaint.objects.create(user=self.user, name='placeholder', division='A', complaint='placeholder')
+        Complaint.objects.filter(pk=obj.pk).update(
+            name=None, complaint=None,
+            name_legacy=legacy_value(name, key), complaint_legacy=legacy_value(complaint, key),
+        )
+        return obj.pk
+
+    def stored(self, pk):
+        with stored_values():
+            values = Complaint.objects.values_list('name', 'complaint').get(pk=pk)
+        return tuple(value.value for value in values)
+
+    def legacy_columns(self, pk):
+        return Complaint.objects.values_list('name_legacy', 'complaint_legacy').get(pk=pk)
+
+    def test_legacy_and_compact_values_read_side_by_side(self):
+        legacy = self.make_legacy('Old Name', 'Old complaint', encryption_manager.load_key())
+        compact = Complaint.objects.create(user=self.user, name='New Name', division='A', complaint='New complaint').pk
+
+        expected = {legacy: ('Old Name', 'Old complaint'), compact: ('New Name', 'New complaint')}
+        for queryset in (Complaint.objects.all(), Complaint.objects.batch_decrypt(), Complaint.objects.lazy_decrypt()):
+            self.assertEqual({c.pk: (str(c.name), str(c.complaint)) for c in queryset}, expected)
+        self.assertEqual(dict(Complaint.objects.values_list('pk', 'name')), {pk: v[0] for pk, v in expected.items()})
+
+        call_command('compact_encrypted_fields', stdout=StringIO())
+        self.assertEqual(self.legacy_columns(legacy), ('', ''))
+        self.assertTrue(all(is_compact(value) for value in self.stored(legacy)))
+        self.assertEqual({c.pk: (c.name, c.complaint) for c in Complaint.objects.all()}, expected)
+
+    def test_rotation_leaves_values_of_unknown_keys_unchanged(self):
+        old_key = Fernet.generate_key()
+        pk = self.make_legacy('Alice', 'Lost key', old_key)
+        before = self.stored(pk)
+
+        # The key the row was written with isn't configured
+        err = StringIO()
+        call_command('rotate_encryption_keys', stdout=StringIO(), stderr=err)
+        self.assertIn('2 values could not be decrypted', err.getvalue())
+        self.assertEqual(self.stored(pk), before)
+
+        with override_settings(ENCRYPTION_RETIRED_KEYS=[old_key.decode()]):
+            encryption_manager.reset()
+            self.assertEqual(Complaint.objects.get(pk=pk).name, 'Alice')
+            call_command('rotate_encryption_keys', '--restart', stdout=StringIO(), stderr=StringIO())
+
+        # Now encrypted under the primary key alone
+        encryption_manager.reset()
+        complaint = Complaint.objects.get(pk=pk)
+        self.assertEqual((complaint.name, complaint.complaint), ('Alice', 'Lost key'))
+        self.assertTrue(all(is_compact(value) for value in self.stored(pk)))
+
+    def test_rotation_encrypts_unencrypted_legacy_text(self):
+        pk = Complaint.objects.create(user=self.user, name='x', division='A', complaint='x').pk
+        Complaint.objects.filter(pk=pk).update(name=None, complaint=None, name_legacy='Plain', complaint_legacy='Plain text')
+
+        call_command('rotate_encryption_keys', stdout=StringIO(), stderr=StringIO())
+        complaint = Complaint.objects.get(pk=pk)
+        self.assertEqual((complaint.name, complaint.complaint), ('Plain', 'Plain text'))
+        self.assertTrue(all(is_compact(value) for value in self.stored(pk)))
+
+
+class SearchIndexTests(TestCase):
+    """Saving a complaint only rewrites its search tokens when name or text changed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='student')
+
+    def token_writes(self, save):
+        with CaptureQueriesContext(connection) as ctx:
+            save()
+        return [q['sql'] for q in ctx.captured_queries if 'complaintsearchtoken' in q['sql'].lower()]
+
+    def test_status_change_keeps_tokens(self):
+        pk = Complaint.objects.create(user=self.user, name='Asha', division='A', complaint='Broken fan').pk
+        tokens = set(ComplaintSearchToken.objects.filter(complaint_id=pk).values_list('field', 'token'))
+
+        for complaint in (Complaint.objects.get(pk=pk), Complaint.objects.batch_decrypt().get(pk=pk),
+                          Complaint.objects.lazy_decrypt().get(pk=pk)):
+            complaint.status = 'in_progress'
+            self.assertEqual(self.token_writes(complaint.save), [])
+        self.assertEqual(set(ComplaintSearchToken.objects.filter(complaint_id=pk).values_list('field', 'token')), tokens)
+
+    def test_text_change_reindexes(self):
+        complaint = Complaint.objects.create(user=self.user, name='Asha', division='A', complaint='Broken fan')
+        complaint = Complaint.objects.get(pk=complaint.pk)
+        complaint.complaint = 'Leaking tap'
+        complaint.save()
+
+        self.assertEqual(complaint.preview, 'Leaking tap')
+        self.assertTrue(Complaint.objects.filter(blind_index_q('leaking')).exists())
+        self.assertFalse(Complaint.objects.filter(blind_index_q('broken')).exists())
+
+    def test_create_skips_delete(self):
+        writes = self.token_writes(lambda: Complaint.objects.create(
+            user=self.user, name='Asha', division='A', complaint='Broken fan'))
+        self.assertFalse([sql for sql in writes if sql.startswith('DELETE')])
+        self.assertTrue(writes)
+
+
+class ComplaintCounterTests(TestCase):
+    """Every write path keeps the status counters exact and ids unique from 100 up"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create(username='student')
+        cls.admin = User.objects.create(username='admin', is_staff=True)
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fans = ComplaintCategory.objects.create(name='Fans')
+            self.taps = ComplaintCategory.objects.create(name='Taps')
+        self.client.force_login(self.admin)
+
+    def create(self, count=1, **fields):
+        fields = {'user': self.student, 'name': 'Asha', 'division': 'A', 'complaint': 'Broken fan',
+                  'category': self.fans, **fields}
+        return [Complaint.objects.create(**fields) for _ in range(count)]
+
+    def totals(self):
+        # Emptied counters stay behind as zero rows
+        return {status: total for status, total in status_totals().items() if total}
+
+    def assertConsistent(self):
+        self.assertEqual(rebuild_counters(), {})
+        ids = list(Complaint.objects.values_list('id', flat=True))
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertTrue(all(pk >= 100 for pk in ids), ids)
+
+    def test_create_and_bulk_create(self):
+        self.create(3)
+        Complaint.objects.bulk_create([
+            Complaint(user=self.student, name='Ravi', division='B', complaint='Leaking tap', category=self.taps)
+            for _ in range(5)
+        ])
+        self.assertEqual(self.totals(), {'pending': 8})
+        self.assertConsistent()
+
+    def test_edit_moves_division_and_category(self):
+        first, second = self.create(2)
+        first.division = 'B'
+        first.category = self.taps
+        first.save()
+        second.division = 'C'
+        second.save(update_fields=['division'])
+        self.assertConsistent()
+
+    def test_single_status_change(self):
+        complaint, = self.create()
+        response = self.client.post('/AdminPanel/', {
+            'complaint_id': complaint.id, 'new_status': 'resolved', 'admin_response': 'Fixed',
+        }, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(), {'resolved': 1})
+        self.assertConsistent()
+
+    def test_bulk_status_change(self):
+        complaints = self.create(3) + self.create(2, status='in_progress', division='B')
+        response = self.client.post('/AdminPanel/', {
+            'bulk_action': '1', 'new_status': 'resolved', 'complaint_ids': [c.id for c in complaints[1:]],
+        }, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(), {'pending': 1, 'resolved': 4})
+        updates = ComplaintUpdate.objects.filter(new_status='resolved')
+        self.assertEqual(sorted(updates.values_list('complaint_id', 'old_status')), sorted(
+            (c.id, c.status) for c in complaints[1:]
+        ))
+        self.assertFalse(Complaint.objects.filter(status='resolved', resolved_date__isnull=True).exists())
+        self.assertConsistent()
+
+    def test_delete(self):
+        complaints = self.create(4)
+        complaints[0].delete()
+        Complaint.objects.filter(pk__in=[c.pk for c in complaints[1:3]]).delete()
+        self.assertEqual(self.totals(), {'pending': 1})
+        # Cascades from the user go through pre_delete too
+        self.student.delete()
+        self.assertEqual(self.totals(), {})
+        self.assertConsistent()
+
+    def test_category_delete(self):
+        self.create(2)
+        self.create(1, category=self.taps)
+        self.fans.delete()
+        self.assertEqual(Complaint.objects.filter(category__isnull=True).count(), 2)
+        self.assertConsistent()
+
+    def test_ingest(self):
+        self.create(2)
+        result = ingest_complaints([
+            {'username': 'student', 'complaint': f'Imported {i}', 'division': 'B', 'category': 'Taps',
+             'status': 'resolved' if i % 2 else 'pending'}
+            for i in range(7)
+        ] + [{'username': 'nobody', 'complaint': 'x'}], self.admin, batch_size=3)
+        self.assertEqual((result['created'], result['skipped']), (7, 1))
+        self.assertConsistent()
+
+
+class IdAllocatorTests(TransactionTestCase):
+    """Ids come in blocks from IdSequence; outside a transaction a whole block is kept"""
+
+    def allocator(self):
+        return BlockAllocator('test', Complaint, start=100, block_size=5)
+
+    def reserved(self):
+        return IdSequence.objects.get(name='test').next_value
+
+    def test_blocks_start_at_100_and_never_overlap(self):
+        ids, other = self.allocator(), self.allocator()
+        self.assertEqual(ids.allocate(3), [100, 101, 102])
+        self.assertEqual(other.allocate(), [105])
+        # Two left in the block, the rest from a new one
+        self.assertEqual(ids.allocate(4), [103, 104, 110, 111])
+        self.assertEqual(self.reserved(), 115)
+
+    def test_transaction_reserves_only_what_it_needs(self):
+        ids = self.allocator()
+        with transaction.atomic():
+            self.assertEqual(ids.allocate(2), [100, 101])
+        self.assertEqual(self.reserved(), 102)
+        self.assertEqual(ids.allocate(), [102])
+
+    def test_forked_process_takes_a_new_block(self):
+        ids = self.allocator()
+        self.assertEqual(ids.allocate(), [100])
+        with mock.patch('Home.sequences.os.getpid', return_value=os.getpid() + 1):
+            self.assertEqual(ids.allocate(), [105])
@@ -0,0 +1,77 @@
+"""
+Processing of uploaded complaint and action images
+
+Phone photos are often 5-10 MB. Before an upload is stored it is checked
+against UPLOAD_MAX_BYTES, rotated according to its EXIF orientation,
+downscaled to at most IMAGE_MAX_DIMENSION pixels per side and re-encoded
+without any metadata (which also drops GPS positions). A thumbnail of at
+most IMAGE_THUMBNAIL_SIZE pixels is stored next to it; pages show the
+thumbnail and link to the full image.
+
+Files that aren't images are stored unchanged, without a thumbnail. Without
+Pillow every upload is stored unchanged.
+"""
+import io
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.template.defaultfilters import filesizeformat
+
+try:
+    from PIL import Image, ImageOps
+
+    IMAGES_AVAILABLE = True
+except ImportError:
+    IMAGES_AVAILABLE = False
+
+
+class UploadError(ValueError):
+    """An upload that can't be stored; the message is shown to the user"""
+
+
+def _encode(image, stem, quality):
+    """Image re-encoded as JPEG (or PNG if it has transparency), with no metadata"""
+    buffer = io.BytesIO()
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image.save(buffer, 'PNG', optimize=True)
+        extension = 'png'
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+        extension = 'jpg'
+    return ContentFile(buffer.getvalue(), name=f'{stem}.{extension}')
+
+
+def process_upload(upload):
+    """
+    Return (file to store, thumbnail or None) for an uploaded file. Raises
+    UploadError if it is too large or not a usable image.
+    """
+    max_bytes = getattr(settings, 'UPLOAD_MAX_BYTES', 20 * 1024 * 1024)
+    if upload.size > max_bytes:
+        raise UploadError(f'Files can be at most {filesizeformat(max_bytes)}.')
+    if not IMAGES_AVAILABLE:
+        return upload, None
+
+    try:
+        image = Image.open(upload)
+        image.load()
+    except Image.DecompressionBombError:
+        raise UploadError('The image is too large.')
+    except Exception:
+        # Not an image (or not one Pillow reads): kept as uploaded
+        upload.seek(0)
+        return upload, None
+
+    # Apply the orientation before the EXIF data is dropped
+    image = ImageOps.exif_transpose(image)
+    stem = os.path.splitext(os.path.basename(upload.name))[0] or 'image'
+    quality = getattr(settings, 'IMAGE_JPEG_QUALITY', 85)
+
+    max_dimension = getattr(settings, 'IMAGE_MAX_DIMENSION', 2048)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    processed = _encode(image, stem, quality)
+
+    thumb_size = getattr(settings, 'IMAGE_THUMBNAIL_SIZE', 320)
+    image.thumbnail((thumb_size, thumb_size), Image.LANCZOS)
+    thumbnail = _encode(image, f'{stem}_thumb', quality)
+    return processed, thumbnail
@@ -0,0 +1,63 @@
+"""
+Data versions for cheap change detection
+
+A DataVersion row is bumped once after each transaction that changes the
+complaint data. Readers that only need to know whether anything changed,
+such as ETag checks for API pollers, compare a single primary-key lookup
+instead of re-running their queries. Because the versions live in the
+database, every process and serverless instance sees a bump as soon as it
+commits, whatever cache backend is configured.
+"""
+from functools import partial
+from django.db import IntegrityError, connection, models, transaction
+
+COMPLAINTS = 'complaints'
+
+
+def current_version(name=COMPLAINTS):
+    from .models import DataVersion
+
+    return DataVersion.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+
+def _bump(name):
+    from .models import DataVersion
+
+    if DataVersion.objects.filter(name=name).update(version=models.F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(name=name, version=1)
+    except IntegrityError:
+        # Created concurrently
+        DataVersion.objects.filter(name=name).update(version=models.F('version') + 1)
+
+
+def bump_version(name=COMPLAINTS):
+    """
+    Bump a data version once the current transaction commits. Bumping after
+    commit keeps the hot row out of the writer's locks; a reader can at
+    worst pair new data with the old version and refetch on its next poll.
+    """
+    # Bulk writes call this once per row, only queue one bump per transaction
+    for _, callback, _ in connection.run_on_commit:
+        if getattr(callback, 'version_name', None) == name:
+            return
+    callback = partial(_bump, name)
+    callback.version_name = name
+    transaction.on_commit(callback)
+
+
+def _bump_many(names):
+    from .models import DataVersion
+
+    # Create the missing rows, then bump all of them in one statement
+    DataVersion.objects.bulk_create([DataVersion(name=name) for name in names], ignore_conflicts=True)
+    DataVersion.objects.filter(name__in=names).update(version=models.F('version') + 1)
+
+
+def bump_versions(names):
+    """Bump several data versions together once the current transaction commits"""
+    names = sorted(set(names))
+    if names:
+        transaction.on_commit(partial(_bump_many, names))
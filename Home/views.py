@@ -1,31 +1,31 @@
 import os
-import textwrap
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.core.files.storage import FileSystemStorage
+from django.conf import settings
+from django.http import FileResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse
+from django.urls import reverse
+from django.template.loader import render_to_string
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.conf import settings
-from django.core.mail import send_mail
+from Accounts.middleware import get_division
 from Accounts.models import StudentProfile
-from .models import Complaint, ComplaintCategory, ComplaintUpdate
+from .categories import category_cache
+from .counters import status_totals
+from .exports import PDF_AVAILABLE
+from .fragments import admin_panel_cache
+from .models import Complaint, ComplaintUpdate, ReportJob
+from .notifications import notify, notify_many
+from .pagination import paginate
+from .reports import render_report, report_params, request_report
+from .search import filter_complaints
+from .student_lists import student_complaints_page
+from .uploads import UploadError, process_upload
 import uuid
 
-# PDF generation imports
-try:
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib import colors
-
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
-
-
 # Create your views here.
 def login_page(request):
     if request.method == 'POST':
@@ -106,75 +106,71 @@ def home(request):
         category_id = request.POST.get('category')
         priority = request.POST.get('priority', 'medium')
 
-        profile, _ = StudentProfile.objects.get_or_create(user=request.user, defaults={'division': ''})
-        if not profile.division:
+        division = get_division(request)
+        if not division:
             messages.error(request, 'Division information is missing. Please contact support to update your profile.')
             return redirect('home')
 
         display_name = (request.user.first_name or '').strip() or request.user.username
 
-        # Get category object if provided
-        category = None
-        if category_id:
+        # Unknown or missing categories are stored as no category
+        category = category_cache.get(category_id)
+
+        # Images are downscaled, stripped of metadata and get a thumbnail
+        complaint_thumb = None
+        if complaint_img:
             try:
-                category = ComplaintCategory.objects.get(id=category_id)
-            except ComplaintCategory.DoesNotExist:
-                pass
+                complaint_img, complaint_thumb = process_upload(complaint_img)
+            except UploadError as e:
+                messages.error(request, str(e))
+                return redirect('home')
 
         # Create complaint using Django ORM
         complaint_obj = Complaint.objects.create(
             user=request.user,
             name=display_name,
-            division=profile.division,
+            division=division,
             complaint=complaint_text,
             complaint_img=complaint_img,
-            category=category,
+            complaint_thumb=complaint_thumb,
+            category_id=category.id if category else None,
             priority=priority
         )
 
-        # Send confirmation email to user
-        if request.user.email:
-            subject = f'Complaint #{complaint_obj.id} Submitted Successfully'
-            message = (
-                f"Hello {display_name},\n\n"
-                f"We have received your complaint (ID: {complaint_obj.id}).\n"
-                "Our team is currently reviewing the details and will update you once the status changes.\n\n"
-                "Thank you for bringing this to our attention.\n"
-                "We appreciate your patience and will work to resolve it as quickly as possible.\n\n"
-                "Regards,\n"
-                "Management Team\n"
-            )
-
-            from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', '') or getattr(settings, 'EMAIL_HOST_USER', '')
-
-            try:
-                send_mail(
-                    subject,
-                    message,
-                    from_email,
-                    [request.user.email],
-                    fail_silently=False,
-                )
-            except Exception as e:
-                messages.warning(request, f'Complaint saved but email notification failed: {str(e)}')
+        # Confirmation email, merged with any quick follow-up updates (see notifications.py)
+        notify(request.user.id, complaint_obj.id, 'submitted', complaint_obj.status)
 
         messages.success(request, f'Your Complaint ID #{complaint_obj.id} submitted successfully!')
         return redirect('home')
 
     # Get user's complaints and categories for the form
-    user_complaints = Complaint.objects.filter(user=request.user)
-    categories = ComplaintCategory.objects.all()
-
-    profile, _ = StudentProfile.objects.get_or_create(user=request.user, defaults={'division': ''})
+    # Served from the student's cached rows until one of their complaints changes
+    page = student_complaints_page(request.user, request.GET.get('after'), request.GET.get('before'))
+    categories = category_cache.all()
 
     context = {
-        'complaints': user_complaints,
+        'complaints': page,
+        'page': page,
         'categories': categories,
-        'profile': profile
+        'profile': request.profile
     }
     return render(request, 'OpeningPage.html', context)
 
 
+@login_required(login_url='/')
+def email_preferences(request):
+    """Switch the student's complaint update emails between one per change and a daily digest"""
+    if request.method == 'POST':
+        profile = request.profile
+        profile.email_digest = request.POST.get('email_digest') == 'on'
+        profile.save(update_fields=['email_digest'])
+        if profile.email_digest:
+            messages.success(request, 'You will receive one email a day with all complaint updates.')
+        else:
+            messages.success(request, 'You will receive an email for every complaint update.')
+    return redirect('home')
+
+
 def Admin_Login(request):
     if request.method == 'POST':
         username = request.POST.get('adminUsername')
@@ -209,13 +205,17 @@ def Admin_Panel(request):
         return redirect('login_page')
 
     # Handle status updates
+    if request.method == 'POST' and request.POST.get('bulk_action'):
+        return _bulk_status_update(request)
+
     if request.method == 'POST':
         complaint_id = request.POST.get('complaint_id')
         new_status = request.POST.get('new_status')
         admin_response = request.POST.get('admin_response', '')
 
         try:
-            complaint = Complaint.objects.get(id=complaint_id)
+            # Lazily decrypted: name and complaint aren't touched, so they are neither decrypted nor reindexed
+            complaint = Complaint.objects.lazy_decrypt().get(id=complaint_id)
             old_status = complaint.status
 
             complaint.status = new_status
@@ -224,7 +224,11 @@ def Admin_Panel(request):
 
             # Handle action image upload
             if 'action_image' in request.FILES:
-                complaint.action_image = request.FILES['action_image']
+                try:
+                    complaint.action_image, complaint.action_thumb = process_upload(request.FILES['action_image'])
+                except UploadError as e:
+                    messages.error(request, str(e))
+                    return redirect('Admin_Panel')
 
             if new_status == 'resolved':
                 complaint.resolved_date = timezone.now()
@@ -240,100 +244,94 @@ def Admin_Panel(request):
                 update_message=f"Response: {admin_response} | Action: {complaint.action_taken}"
             )
 
-            # Send email notification to user
-            if complaint.user.email:
-                subject = f'Update on Your Complaint #{complaint.id}'
-                message = f"""Hello {complaint.user.first_name or complaint.user.username},
-
-We would like to inform you that the status of your complaint (ID: {complaint.id}) has been updated.
-Current Status: {complaint.get_status_display()}
+            # Status emails are coalesced per student, so a quick walk through
+            # several statuses ends up as a single message
+            notify(complaint.user_id, complaint.id, 'resolved' if new_status == 'resolved' else 'status', new_status)
 
-If you have any further questions or need assistance, feel free to reply to this email.
+            messages.success(request, f'Complaint #{complaint_id} status updated to {new_status}')
 
-Thank you for your cooperation.
+        except Complaint.DoesNotExist:
+            messages.error(request, 'Complaint not found.')
 
-Regards,
-Management Team
+        return redirect('Admin_Panel')
 
+    status_filter = request.GET.get('status')
+    search_query = request.GET.get('search')
 
-"""
+    # The table and analytics only depend on the query string and the data,
+    # so they are shared between admins until the next write
+    listing = admin_panel_cache.get_or_build(
+        dict(request.GET.lists()),
+        lambda: _admin_panel_listing(request, status_filter, search_query),
+    )
 
-                from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', '') or getattr(settings, 'EMAIL_HOST_USER', '')
+    context = {
+        'status_choices': Complaint.STATUS_CHOICES,
+        'priority_choices': Complaint.PRIORITY_CHOICES,
+        'current_status_filter': status_filter,
+        'current_search': search_query,
+        # Recent PDF reports with their progress (not part of the shared cache)
+        'report_jobs': ReportJob.objects.order_by('-created_at')[:5],
+        **listing,
+    }
 
-                try:
-                    send_mail(
-                        subject,
-                        message,
-                        from_email,
-                        [complaint.user.email],
-                        fail_silently=False,
-                    )
-                except Exception as e:
-                    messages.warning(request, f'Status updated but email notification failed: {str(e)}')
-
-                if new_status == 'resolved':
-                    resolved_subject = f'Complaint #{complaint.id} Resolved'
-                    resolved_at = complaint.resolved_date or timezone.now()
-                    resolved_timestamp = timezone.localtime(resolved_at).strftime('%b %d, %Y %H:%M')
-                    resolution_notes = admin_response if admin_response else 'No resolution notes were provided.'
-                    action_notes = complaint.action_taken if complaint.action_taken else 'No additional actions recorded.'
-
-                    resolved_message = f"""Hello {complaint.user.first_name or complaint.user.username},
-
-Your complaint (ID: {complaint.id}) has been marked as resolved.
-
-We hope the issue was addressed to your satisfaction.
-If you believe it is not resolved or requires further attention, you may reopen a new complaint anytime.
-
-Thank you for your trust.
-
-Warm Regards,
-Management Team
-
-"""
-
-                    try:
-                        send_mail(
-                            resolved_subject,
-                            resolved_message,
-                            from_email,
-                            [complaint.user.email],
-                            fail_silently=False,
-                        )
-                    except Exception as e:
-                        messages.warning(request, f'Resolution email could not be sent: {str(e)}')
+    return render(request, 'AdminPanel.html', context)
 
-            messages.success(request, f'Complaint #{complaint_id} status updated to {new_status}')
 
-        except Complaint.DoesNotExist:
-            messages.error(request, 'Complaint not found.')
+def _bulk_status_update(request):
+    """Apply one status, response and action text to all selected complaints"""
+    new_status = request.POST.get('new_status')
+    if new_status not in dict(Complaint.STATUS_CHOICES):
+        messages.error(request, 'Please choose a valid status.')
+        return redirect(request.get_full_path())
+
+    complaint_ids = [int(pk) for pk in request.POST.getlist('complaint_ids') if pk.isdigit()]
+    if not complaint_ids:
+        messages.error(request, 'Select at least one complaint.')
+        return redirect(request.get_full_path())
+
+    event = 'resolved' if new_status == 'resolved' else 'status'
+    with transaction.atomic():
+        rows = Complaint.objects.filter(id__in=complaint_ids).set_status(
+            new_status,
+            request.user,
+            admin_response=request.POST.get('admin_response', ''),
+            action_taken=request.POST.get('action_taken', ''),
+        )
+        # One row per student; the worker merges them into an email each
+        notify_many((row['user_id'], row['id'], event, new_status) for row in rows)
 
-        return redirect('Admin_Panel')
+    messages.success(request, f'{len(rows)} complaint(s) updated to {dict(Complaint.STATUS_CHOICES)[new_status]}')
+    # Back to the same filtered page, rendered once for the whole batch
+    return redirect(request.get_full_path())
 
-    # Get all complaints with filtering options
-    complaints = Complaint.objects.all().select_related('user', 'category').order_by('-complaint_date')
 
-    # Filter by status if specified
-    status_filter = request.GET.get('status')
-    if status_filter:
-        complaints = complaints.filter(status=status_filter)
+def _admin_panel_listing(request, status_filter, search_query):
+    """Analytics numbers and the rendered complaint table for Admin_Panel"""
+    # Get all complaints with filtering options (decrypted only as rows are rendered)
+    complaints = (
+        Complaint.objects.all().select_related('user', 'category').defer('complaint')
+        .lazy_decrypt()
+    )
 
-    # Search functionality
-    search_query = request.GET.get('search')
-    if search_query:
-        complaints = complaints.filter(
-            models.Q(name__icontains=search_query) |
-            models.Q(division__icontains=search_query) |
-            models.Q(complaint__icontains=search_query) |
-            models.Q(user__username__icontains=search_query)
-        )
+    # Status filter and search (the exports apply the same ones)
+    complaints = filter_complaints(complaints, status_filter, search_query)
 
     # Calculate analytics data
-    total_complaints = complaints.count()
-    pending_complaints = complaints.filter(status='pending').count()
-    in_progress = complaints.filter(status='in_progress').count()
-    resolved_complaints = complaints.filter(status='resolved').count()
-    rejected_complaints = complaints.filter(status='rejected').count()
+    if search_query:
+        # Searches can match any subset, so count the matches in a single query
+        totals = complaints.order_by().aggregate(**{
+            status: models.Count('pk', filter=models.Q(status=status))
+            for status, _ in Complaint.STATUS_CHOICES
+        })
+    else:
+        # Otherwise the numbers come from the maintained counters
+        totals = status_totals(status_filter)
+    total_complaints = sum(totals.values())
+    pending_complaints = totals.get('pending', 0)
+    in_progress = totals.get('in_progress', 0)
+    resolved_complaints = totals.get('resolved', 0)
+    rejected_complaints = totals.get('rejected', 0)
     
     # Combine pending and in-progress for the pending card
     pending_plus_in_progress = pending_complaints + in_progress
@@ -343,13 +341,9 @@ Management Team
     resolved_percent = (resolved_complaints / total_complaints * 100) if total_complaints > 0 else 0
     rejected_percent = (rejected_complaints / total_complaints * 100) if total_complaints > 0 else 0
 
-    context = {
-        'complaints': complaints,
-        'status_choices': Complaint.STATUS_CHOICES,
-        'priority_choices': Complaint.PRIORITY_CHOICES,
-        'current_status_filter': status_filter,
-        'current_search': search_query,
-        # Analytics data
+    page = paginate(complaints, request.GET.get('after'), request.GET.get('before'))
+
+    analytics = {
         'total_complaints': total_complaints,
         'pending_complaints': pending_plus_in_progress,  # Combined pending + in-progress
         'in_progress': in_progress,  # Still pass in_progress separately for display
@@ -360,12 +354,17 @@ Management Team
         'rejected_percent': rejected_percent,
     }
 
-    return render(request, 'AdminPanel.html', context)
+    complaint_table = render_to_string(
+        'admin_complaint_table.html',
+        {'complaints': page, 'page': page, 'total_complaints': total_complaints},
+        request=request,
+    )
+    return {**analytics, 'complaint_table': complaint_table}
 
 
 @login_required(login_url='/AdminLogin/')
 def download_complaints_pdf(request):
-    """Generate and download complaints as PDF"""
+    """Download the PDF report for the current filters, or queue it if it isn't built yet"""
     if not (request.user.is_staff or request.user.is_superuser):
         messages.error(request, 'Access denied. Admin privileges required.')
         return redirect('login_page')
@@ -374,74 +373,37 @@ def download_complaints_pdf(request):
         messages.error(request, 'PDF generation is not available. Please install reportlab.')
         return redirect('Admin_Panel')
 
-    # Create the HttpResponse object with the appropriate PDF headers
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="complaints_report.pdf"'
+    # Same filters as the admin panel; reports are built by the run_report_jobs worker
+    params = report_params(request.GET)
+    if getattr(settings, 'REPORT_JOBS_EAGER', False):
+        # No worker, and storage may be read-only: build it now and send it without storing it
+        return _pdf_response(render_report(params))
 
-    # Fetch complaints from Django ORM (instead of direct MySQL)
-    complaints = Complaint.objects.all().select_related('user', 'category').order_by('-complaint_date')
+    job = request_report(params, request.user)
+    if job.status == 'done':
+        # Nothing changed since it was built, so the stored file is current
+        return _pdf_response(job.file.open('rb'))
 
-    # Apply same filters as admin panel
-    status_filter = request.GET.get('status')
-    if status_filter:
-        complaints = complaints.filter(status=status_filter)
+    if job.status == 'failed':
+        messages.error(request, 'The PDF report could not be generated. Please try again.')
+    else:
+        messages.info(request, 'Your PDF report is being prepared. It will appear under Reports when ready.')
+    return redirect(f"{reverse('Admin_Panel')}?{request.GET.urlencode()}")
 
-    search_query = request.GET.get('search')
-    if search_query:
-        complaints = complaints.filter(
-            models.Q(name__icontains=search_query) |
-            models.Q(division__icontains=search_query) |
-            models.Q(complaint__icontains=search_query) |
-            models.Q(user__username__icontains=search_query)
-        )
 
-    # Add table header
-    data = [["ID", "User", "Name", "Division", "Complaint", "Date & Time", "Status", "Priority"]]
-
-    # Helper function for wrapping long text
-    def wrap_text(text, width=30):
-        if not text:
-            return ""
-        return "\n".join(textwrap.wrap(str(text), width))
-
-    # Add complaint data
-    for complaint in complaints:
-        wrapped_row = [
-            str(complaint.id),
-            complaint.user.username,
-            wrap_text(complaint.name, 25),
-            wrap_text(complaint.division, 20),
-            wrap_text(complaint.complaint, 25),  # complaint wrapped
-            complaint.complaint_date.strftime('%Y-%m-%d %H:%M'),
-            complaint.get_status_display(),
-            complaint.get_priority_display()
-        ]
-        data.append(wrapped_row)
-
-    # Create PDF using response as file
-    pdf = SimpleDocTemplate(response, pagesize=letter)
-    table = Table(data, repeatRows=1, colWidths=[30, 60, 70, 60, 120, 80, 60, 50])  # repeat header on new pages
-
-    # Add style to the table
-    style = TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.cyan),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("FONTSIZE", (0, 0), (-1, 0), 10),
-        ("FONTSIZE", (0, 1), (-1, -1), 8),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-        ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
-        ("GRID", (0, 0), (-1, -1), 1, colors.black),
-        ("VALIGN", (0, 0), (-1, -1), "TOP"),
-    ])
-
-    table.setStyle(style)
-
-    # Build the PDF
-    pdf.build([table])
-
-    return response
+@login_required(login_url='/AdminLogin/')
+def download_report(request, job_id):
+    """A finished report by id (linked from the Reports list)"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        messages.error(request, 'Access denied. Admin privileges required.')
+        return redirect('login_page')
+
+    return _pdf_response(get_object_or_404(ReportJob, pk=job_id, status='done').file.open('rb'))
+
+
+def _pdf_response(file):
+    return FileResponse(file, as_attachment=True, filename='complaints_report.pdf',
+                        content_type='application/pdf')
 
 
 @login_required(login_url='/')
@@ -472,38 +434,35 @@ def edit_complaint(request, complaint_id):
 
         if request.method == 'POST':
             # Update complaint fields
-            profile, _ = StudentProfile.objects.get_or_create(user=request.user, defaults={'division': ''})
+            division = get_division(request)
             complaint.name = (request.user.first_name or '').strip() or request.user.username
-            if profile.division:
-                complaint.division = profile.division
+            if division:
+                complaint.division = division
             complaint.complaint = request.POST.get('complaint')
             complaint.priority = request.POST.get('priority', 'medium')
 
             # Handle category
-            category_id = request.POST.get('category')
-            if category_id:
-                try:
-                    complaint.category = ComplaintCategory.objects.get(id=category_id)
-                except ComplaintCategory.DoesNotExist:
-                    complaint.category = None
-            else:
-                complaint.category = None
+            category = category_cache.get(request.POST.get('category'))
+            complaint.category_id = category.id if category else None
 
             # Handle file upload
             new_file = request.FILES.get('complaint_img')
             if new_file:
-                complaint.complaint_img = new_file
+                try:
+                    complaint.complaint_img, complaint.complaint_thumb = process_upload(new_file)
+                except UploadError as e:
+                    messages.error(request, str(e))
+                    return redirect('edit_complaint', complaint_id=complaint.id)
 
             complaint.save()
             messages.success(request, f'Complaint #{complaint_id} updated successfully!')
             return redirect('home')
 
-        categories = ComplaintCategory.objects.all()
-        profile, _ = StudentProfile.objects.get_or_create(user=request.user, defaults={'division': ''})
+        categories = category_cache.all()
         context = {
             'complaint': complaint,
             'categories': categories,
-            'profile': profile
+            'profile': request.profile
         }
         return render(request, 'edit.html', context)
 
@@ -53,10 +53,21 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Accounts.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# ProfileBackend loads the user and their StudentProfile in one query;
+# ModelBackend stays listed so sessions created before it keep working
+AUTHENTICATION_BACKENDS = [
+    'Accounts.backends.ProfileBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Seconds a student's division is kept in their session (0 disables)
+PROFILE_DIVISION_SESSION_SECONDS = int(os.environ.get('PROFILE_DIVISION_SESSION_SECONDS', '0'))
+
 ROOT_URLCONF = 'MiniProject.urls'
 
 TEMPLATES = [
@@ -132,6 +143,18 @@ STATIC_ROOT = BASE_DIR / 'staticfiles_build' / 'static'
 # Media files (uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Uploaded images are capped, downscaled to IMAGE_MAX_DIMENSION pixels per
+# side, re-encoded without metadata and get an IMAGE_THUMBNAIL_SIZE thumbnail
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '2048'))
+IMAGE_THUMBNAIL_SIZE = int(os.environ.get('IMAGE_THUMBNAIL_SIZE', '320'))
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', '85'))
+
+# Attachments are stored once per distinct content and reference counted;
+# `python manage.py reconcile_blobs` deletes blobs unreferenced this long
+BLOB_GRACE_HOURS = int(os.environ.get('BLOB_GRACE_HOURS', '24'))
+
 # Default primary key field type
 
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -141,6 +164,64 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Encryption key for sensitive data (change this in production)
 ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY')
 
+# Key derivation is deferred until first use. To skip it entirely, set the
+# output of `python manage.py derive_encryption_key` as ENCRYPTION_DERIVED_KEY,
+# or point ENCRYPTION_KEY_CACHE at a file to derive once per host.
+ENCRYPTION_DERIVED_KEY = os.environ.get('ENCRYPTION_DERIVED_KEY')
+ENCRYPTION_KEY_CACHE = os.environ.get('ENCRYPTION_KEY_CACHE')
+
+# Per-installation salt for deriving the key from ENCRYPTION_KEY
+ENCRYPTION_SALT = os.environ.get('ENCRYPTION_SALT', 'salt_1234567890')
+
+# Comma-separated, pre-derived keys that are still accepted for decryption
+# while `python manage.py rotate_encryption_keys` moves data to the new key
+ENCRYPTION_RETIRED_KEYS = [key for key in os.environ.get('ENCRYPTION_RETIRED_KEYS', '').split(',') if key]
+
+# Secret for the blind search index (defaults to ENCRYPTION_KEY). Pin it to
+# the old secret when rotating ENCRYPTION_KEY, or run reindex_complaints.
+SEARCH_INDEX_KEY = os.environ.get('SEARCH_INDEX_KEY')
+
+# Number of decrypted values kept in each process' LRU cache (0 disables it)
+ENCRYPTION_CACHE_SIZE = int(os.environ.get('ENCRYPTION_CACHE_SIZE', '4096'))
+
+# Complaint ids reserved per worker process at a time
+ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', '20'))
+
+# Rows fetched (and decrypted) per database round trip by report exports
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '500'))
+# CSV/NDJSON rows sent to the client per write
+EXPORT_ROWS_PER_WRITE = int(os.environ.get('EXPORT_ROWS_PER_WRITE', '100'))
+
+# Serverless deployments (Vercel sets VERCEL=1) have no worker processes, so
+# the outbox and report jobs default to running inside the request there
+SERVERLESS = bool(os.environ.get('VERCEL'))
+_EAGER_DEFAULT = 'True' if SERVERLESS else 'False'
+
+# PDF reports are built by `python manage.py run_report_jobs` and kept for
+# REPORT_RETENTION_HOURS. REPORT_JOBS_EAGER builds them inside the request
+# instead and sends them without storing them (for development and serverless
+# deployments, whose filesystem is read-only).
+REPORT_JOBS_EAGER = os.environ.get('REPORT_JOBS_EAGER', _EAGER_DEFAULT).lower() == 'true'
+REPORT_RETENTION_HOURS = int(os.environ.get('REPORT_RETENTION_HOURS', '24'))
+
+# Cache used for rendered fragments (locmem is per process; point
+# CACHE_BACKEND/CACHE_LOCATION at Redis or Memcached to share it)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Seconds a cached Admin_Panel fragment is kept (writes make it unreachable sooner)
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', '300'))
+
+# Categories are cached in each process: their version in the database is checked at
+# most every CATEGORY_CACHE_CHECK_SECONDS, and entries are reloaded after
+# CATEGORY_CACHE_TTL seconds regardless
+CATEGORY_CACHE_TTL = int(os.environ.get('CATEGORY_CACHE_TTL', '300'))
+CATEGORY_CACHE_CHECK_SECONDS = int(os.environ.get('CATEGORY_CACHE_CHECK_SECONDS', '5'))
+
 # Email Configuration
 # Default to SMTP backend with environment-driven overrides
 EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND')
@@ -156,3 +237,22 @@ if EMAIL_USE_SSL and EMAIL_USE_TLS:
     EMAIL_USE_SSL = False
 
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER )
+
+# Notification emails are queued in the database and delivered by
+# `python manage.py send_outbox`. EMAIL_OUTBOX_EAGER delivers them right
+# after each request's commit instead (for development/tests with the
+# console or locmem backend, and serverless deployments).
+EMAIL_OUTBOX_EAGER = os.environ.get('EMAIL_OUTBOX_EAGER', _EAGER_DEFAULT).lower() == 'true'
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+EMAIL_OUTBOX_RETRY_SECONDS = int(os.environ.get('EMAIL_OUTBOX_RETRY_SECONDS', '60'))
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', '30'))
+
+# A student's notifications are merged into one email once the oldest is
+# NOTIFICATION_COALESCE_SECONDS old. Students with the daily digest enabled,
+# or with more than NOTIFICATION_DIGEST_THRESHOLD notifications per digest
+# period (0 disables this), get one email per NOTIFICATION_DIGEST_SECONDS.
+# Without a worker nothing flushes notifications later, so serverless
+# deployments send them straight after the commit by default
+NOTIFICATION_COALESCE_SECONDS = int(os.environ.get('NOTIFICATION_COALESCE_SECONDS', '0' if SERVERLESS else '300'))
+NOTIFICATION_DIGEST_SECONDS = int(os.environ.get('NOTIFICATION_DIGEST_SECONDS', '86400'))
+NOTIFICATION_DIGEST_THRESHOLD = int(os.environ.get('NOTIFICATION_DIGEST_THRESHOLD', '0'))
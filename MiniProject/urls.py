@@ -19,22 +19,33 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 
-from Home.views import (home, Admin_Login, Admin_Panel, login_page, signup_page, logout_page, download_complaints_pdf, view_complaint, edit_complaint, delete_complaint)
+from Home.views import (home, email_preferences, Admin_Login, Admin_Panel, login_page, signup_page, logout_page, download_complaints_pdf, download_report, view_complaint, edit_complaint, delete_complaint)
+from Home import api
 
 urlpatterns = [
     path('', login_page, name='login_page'),
     path('logout/', logout_page, name='logout_page'),
     path('signup/', signup_page, name='signup_page'),
     path('home/', home, name='home'),
+    path('email-preferences/', email_preferences, name='email_preferences'),
     path('AdminLogin/', Admin_Login, name='Admin_Login'),
     path('AdminPanel/', Admin_Panel, name='Admin_Panel'),
     path('download-pdf/', download_complaints_pdf, name='download_complaints_pdf'),
+    path('reports/<int:job_id>/download/', download_report, name='download_report'),
 
     # Complaint actions for users
     path('complaints/<int:complaint_id>/', view_complaint, name='view_complaint'),
     path('complaints/<int:complaint_id>/edit/', edit_complaint, name='edit_complaint'),
     path('complaints/<int:complaint_id>/delete/', delete_complaint, name='delete_complaint'),
 
+    # Read-only JSON API for dashboards (staff only)
+    path('api/complaints/', api.complaint_list, name='api_complaint_list'),
+    path('api/complaints/export.<str:fmt>', api.complaint_export, name='api_complaint_export'),
+    path('api/reports/<int:job_id>/', api.report_status, name='api_report_status'),
+    path('api/complaints/<int:complaint_id>/', api.complaint_detail, name='api_complaint_detail'),
+    path('api/complaints/<int:complaint_id>/updates/', api.complaint_updates, name='api_complaint_updates'),
+    path('api/stats/', api.cache_stats, name='api_cache_stats'),
+
     path('admin/', admin.site.urls),
 ]
 
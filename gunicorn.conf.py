@@ -0,0 +1,24 @@
+"""
+Gunicorn configuration, picked up automatically from the project root.
+
+Set ENCRYPTION_PREDERIVE=true to derive the encryption key once in the master
+process: workers forked afterwards inherit it instead of each running PBKDF2
+on their first request.
+"""
+import os
+
+
+def on_starting(server):
+    if os.environ.get('ENCRYPTION_PREDERIVE', 'False').lower() != 'true':
+        return
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MiniProject.settings')
+
+    import django
+    django.setup()
+
+    from Home.encryption import encryption_manager
+    encryption_manager.warm()
+    server.log.info('Encryption key derived before forking workers')